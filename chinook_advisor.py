@@ -0,0 +1,254 @@
+import argparse
+import json
+import re
+
+from chinook_db import raw_connection
+
+
+# the query workload the advisor looks at: the six canonical queries plus
+# the filters we run most often
+WORKLOAD = [
+    ("all_artists", 'SELECT * FROM "Artist"', None),
+    ("artist_names", 'SELECT "Name" FROM "Artist"', None),
+    ("artist_queen", 'SELECT * FROM "Artist" WHERE "Name" = %s', ["Queen"]),
+    ("artist_51", 'SELECT * FROM "Artist" WHERE "ArtistId" = %s', [51]),
+    (
+        "albums_of_artist_51",
+        'SELECT * FROM "Album" WHERE "ArtistId" = %s', [51]
+    ),
+    (
+        "tracks_by_queen",
+        'SELECT * FROM "Track" WHERE "Composer" = %s', ["Queen"]
+    ),
+    (
+        "artists_by_name",
+        'SELECT * FROM "Artist" ORDER BY "Name" LIMIT 50', None
+    ),
+]
+
+# sorts cheaper than this (in planner cost units) are not worth an index
+SORT_COST_THRESHOLD = 1000.0
+# only recommend indexes that at least make the query this much faster
+MIN_SPEEDUP = 1.2
+
+IDENTIFIER_PATTERN = re.compile(r'"([^"]+)"')
+
+
+def explain(cursor, sql, params, analyze=True):
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    cursor.execute("EXPLAIN (%s) %s" % (options, sql), params)
+    return cursor.fetchone()[0][0]
+
+
+def walk(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        for node in walk(child):
+            yield node
+
+
+# find the expensive nodes of one plan: sequential scans that filter rows
+# out, and sorts above the cost threshold, each with the columns involved
+def find_problems(plan):
+    problems = []
+    for node in walk(plan["Plan"]):
+        node_type = node["Node Type"]
+        if node_type == "Seq Scan" and "Filter" in node:
+            columns = [
+                name for name in IDENTIFIER_PATTERN.findall(node["Filter"])
+                if name != node["Relation Name"]
+            ]
+            problems.append({
+                "kind": "seq scan",
+                "table": node["Relation Name"],
+                "columns": list(dict.fromkeys(columns)),
+                "rows_removed": node.get("Rows Removed by Filter", 0),
+            })
+        elif (node_type == "Sort"
+              and node["Total Cost"] >= SORT_COST_THRESHOLD):
+            columns = []
+            for key in node.get("Sort Key", []):
+                names = IDENTIFIER_PATTERN.findall(key)
+                if names:
+                    columns.append(names[-1])
+            scans = [
+                child for child in walk(node)
+                if child["Node Type"] == "Seq Scan"
+            ]
+            if scans and columns:
+                problems.append({
+                    "kind": "sort",
+                    "table": scans[0]["Relation Name"],
+                    "columns": columns,
+                    "cost": node["Total Cost"],
+                })
+    return problems
+
+
+def index_name(table, columns):
+    return "IX_%s%s" % (table, "".join(columns))
+
+
+def index_sql(table, columns):
+    return 'CREATE INDEX "%s" ON "%s" (%s)' % (
+        index_name(table, columns),
+        table,
+        ", ".join('"%s"' % column for column in columns)
+    )
+
+
+def has_hypopg(cursor):
+    cursor.execute(
+        "SELECT 1 FROM pg_extension WHERE extname = 'hypopg'"
+    )
+    return cursor.fetchone() is not None
+
+
+# hypothetical index (hypopg): nothing is built, so only planner cost can
+# be compared, not execution time
+def try_hypothetical(cursor, candidate, sql, params):
+    cursor.execute("SELECT hypopg_reset()")
+    cursor.execute(
+        "SELECT indexrelid FROM hypopg_create_index(%s)",
+        [index_sql(candidate["table"], candidate["columns"])]
+    )
+    plan = explain(cursor, sql, params, analyze=False)
+    cursor.execute("SELECT hypopg_reset()")
+    return {"cost": plan["Plan"]["Total Cost"]}
+
+
+# real index inside a transaction that is always rolled back, so the
+# speedup is measured on actual execution time; note that CREATE INDEX
+# blocks writes to the table until the rollback
+def try_transactional(connection, candidate, sql, params):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(index_sql(candidate["table"], candidate["columns"]))
+        cursor.execute('ANALYZE "%s"' % candidate["table"])
+        plan = explain(cursor, sql, params)
+    finally:
+        connection.rollback()
+    return {
+        "cost": plan["Plan"]["Total Cost"],
+        "execution_ms": plan["Execution Time"],
+    }
+
+
+def advise(connection, workload=WORKLOAD, hypothetical=None):
+    cursor = connection.cursor()
+    if hypothetical is None:
+        hypothetical = has_hypopg(cursor)
+        connection.rollback()
+
+    report = []
+    for name, sql, params in workload:
+        baseline = explain(cursor, sql, params)
+        connection.rollback()
+        entry = {
+            "query": name,
+            "sql": sql,
+            "cost": baseline["Plan"]["Total Cost"],
+            "execution_ms": baseline["Execution Time"],
+            "problems": find_problems(baseline),
+            "candidates": [],
+        }
+        for problem in entry["problems"]:
+            if not problem["columns"]:
+                continue
+            candidate = {
+                "table": problem["table"],
+                "columns": problem["columns"],
+                "sql": index_sql(problem["table"], problem["columns"]),
+            }
+            if hypothetical:
+                measured = try_hypothetical(cursor, candidate, sql, params)
+                connection.rollback()
+                candidate["method"] = "hypothetical"
+                candidate["cost"] = measured["cost"]
+                candidate["speedup"] = (
+                    entry["cost"] / measured["cost"]
+                    if measured["cost"] else 0.0
+                )
+            else:
+                measured = try_transactional(
+                    connection, candidate, sql, params
+                )
+                candidate["method"] = "transactional"
+                candidate.update(measured)
+                candidate["speedup"] = (
+                    entry["execution_ms"] / measured["execution_ms"]
+                    if measured["execution_ms"] else 0.0
+                )
+            candidate["recommended"] = candidate["speedup"] >= MIN_SPEEDUP
+            entry["candidates"].append(candidate)
+        report.append(entry)
+    return report
+
+
+def recommended_indexes(report):
+    indexes = {}
+    for entry in report:
+        for candidate in entry["candidates"]:
+            if candidate["recommended"]:
+                indexes[candidate["sql"]] = candidate
+    return list(indexes.values())
+
+
+def print_report(report):
+    for entry in report:
+        print(
+            entry["query"],
+            "%.3f ms" % entry["execution_ms"],
+            "cost %.1f" % entry["cost"],
+            sep=" | "
+        )
+        for problem in entry["problems"]:
+            print("   ", problem["kind"], "on", problem["table"],
+                  problem["columns"])
+        for candidate in entry["candidates"]:
+            print(
+                "    ->",
+                candidate["sql"],
+                "%s x%.2f" % (candidate["method"], candidate["speedup"]),
+                "recommended" if candidate["recommended"] else "skipped",
+                sep=" | "
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Suggest indexes for the Chinook query workload"
+    )
+    parser.add_argument(
+        "--transactional", action="store_true",
+        help="build real indexes in rolled back transactions even when "
+             "hypopg is installed"
+    )
+    parser.add_argument(
+        "--apply", action="store_true",
+        help="create the recommended indexes"
+    )
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    with raw_connection() as connection:
+        report = advise(
+            connection,
+            hypothetical=False if args.transactional else None
+        )
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
+
+        if args.apply:
+            cursor = connection.cursor()
+            for candidate in recommended_indexes(report):
+                cursor.execute(candidate["sql"])
+                print("created", index_name(
+                    candidate["table"], candidate["columns"]
+                ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from chinook_db import (
+    DATABASE, MAX_OVERFLOW, POOL_RECYCLE, POOL_SIZE, POOL_TIMEOUT
+)
+from chinook_models import album_table, artist_table, track_table
+
+
+# asyncio access to the same Artist/Album/Track queries, through the
+# asyncpg driver, so independent lookups can run at the same time, each on
+# its own pooled connection
+ASYNC_DATABASE_URL = "postgresql+asyncpg:///" + DATABASE
+
+_engine = None
+
+
+def get_async_engine():
+    global _engine
+    if _engine is None:
+        _engine = create_async_engine(
+            ASYNC_DATABASE_URL,
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_timeout=POOL_TIMEOUT,
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+    return _engine
+
+
+async def dispose():
+    global _engine
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
+
+
+# run one Expression Language select on a connection of its own
+async def fetch(select_query):
+    async with get_async_engine().connect() as connection:
+        result = await connection.execute(select_query)
+        return result.fetchall()
+
+
+# Query 1 - select all records from the "Artist" table
+async def all_artists():
+    return await fetch(artist_table.select())
+
+
+# Query 2 - select only the "Name" column from the "Artist" table
+async def artist_names():
+    return await fetch(
+        artist_table.select().with_only_columns([artist_table.c.Name])
+    )
+
+
+# Query 3 - select an artist by "Name"
+async def artists_by_name(name):
+    return await fetch(
+        artist_table.select().where(artist_table.c.Name == name)
+    )
+
+
+# Query 4 - select an artist by "ArtistId"
+async def artist_by_id(artist_id):
+    rows = await fetch(
+        artist_table.select().where(artist_table.c.ArtistId == artist_id)
+    )
+    return rows[0] if rows else None
+
+
+# Query 5 - select the albums of an artist
+async def albums_by_artist(artist_id):
+    return await fetch(
+        album_table.select().where(album_table.c.ArtistId == artist_id)
+    )
+
+
+# Query 6 - select all tracks by a composer
+async def tracks_by_composer(composer):
+    return await fetch(
+        track_table.select().where(track_table.c.Composer == composer)
+    )
+
+
+# every track on any album of an artist
+async def tracks_by_artist(artist_id):
+    album_ids = (
+        album_table.select()
+        .with_only_columns([album_table.c.AlbumId])
+        .where(album_table.c.ArtistId == artist_id)
+    )
+    return await fetch(
+        track_table.select().where(track_table.c.AlbumId.in_(album_ids))
+    )
+
+
+# artist, albums and tracks issued together: the whole thing takes as long
+# as the slowest of the three queries, not their sum
+async def artist_overview(artist_id):
+    artist, albums, tracks = await asyncio.gather(
+        artist_by_id(artist_id),
+        albums_by_artist(artist_id),
+        tracks_by_artist(artist_id)
+    )
+    return {"artist": artist, "albums": albums, "tracks": tracks}
+
+
+# run any number of independent lookups concurrently, e.g.
+# await gather_all(artist_by_id(1), artist_by_id(2), artist_by_id(3))
+async def gather_all(*lookups):
+    return await asyncio.gather(*lookups)
+
+
+async def main(artist_id):
+    try:
+        started = time.perf_counter()
+        overview = await artist_overview(artist_id)
+        elapsed = time.perf_counter() - started
+    finally:
+        await dispose()
+
+    artist = overview["artist"]
+    if artist is None:
+        print("No artist found")
+        return
+    print(artist.ArtistId, artist.Name, sep=" | ")
+    for album in overview["albums"]:
+        print("   ", album.AlbumId, album.Title, sep=" | ")
+    print(
+        "%d albums" % len(overview["albums"]),
+        "%d tracks" % len(overview["tracks"]),
+        "%.3fs" % elapsed,
+        sep=" | "
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fetch an artist, its albums and tracks concurrently"
+    )
+    parser.add_argument("artist_id", nargs="?", type=int, default=51)
+    args = parser.parse_args()
+    asyncio.run(main(args.artist_id))
@@ -0,0 +1,290 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from sqlalchemy.orm import sessionmaker
+
+from chinook_db import db, get_raw_pool, pool_stats
+from chinook_models import (
+    Album, Artist, Track, album_table, artist_table, track_table
+)
+
+
+WARMUP = 3
+REPEAT = 20
+PERCENTILES = [50, 90, 95, 99]
+
+QUERY_NAMES = [
+    "all_artists",
+    "artist_names",
+    "artist_queen",
+    "artist_51",
+    "albums_of_artist_51",
+    "tracks_by_queen",
+]
+
+
+# the six canonical queries, written once for each access layer;
+# every function takes the open handle of its layer and returns all rows
+
+# sql-psycopg2.py: raw SQL through a psycopg2 cursor
+def psycopg2_query(sql, params=None):
+    def run(connection):
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        results = cursor.fetchall()
+        cursor.close()
+        return results
+    return run
+
+
+PSYCOPG2_QUERIES = {
+    "all_artists": psycopg2_query('SELECT * FROM "Artist"'),
+    "artist_names": psycopg2_query('SELECT "Name" FROM "Artist"'),
+    "artist_queen": psycopg2_query(
+        'SELECT * FROM "Artist" WHERE "Name" = %s', ["Queen"]
+    ),
+    "artist_51": psycopg2_query(
+        'SELECT * FROM "Artist" WHERE "ArtistId" = %s', [51]
+    ),
+    "albums_of_artist_51": psycopg2_query(
+        'SELECT * FROM "Album" WHERE "ArtistId" = %s', [51]
+    ),
+    "tracks_by_queen": psycopg2_query(
+        'SELECT * FROM "Track" WHERE "Composer" = %s', ["Queen"]
+    ),
+}
+
+
+# sql-expression.py: Expression Language selects on a Core connection
+def core_query(select_query):
+    def run(connection):
+        return connection.execute(select_query).fetchall()
+    return run
+
+
+CORE_QUERIES = {
+    "all_artists": core_query(artist_table.select()),
+    "artist_names": core_query(
+        artist_table.select().with_only_columns([artist_table.c.Name])
+    ),
+    "artist_queen": core_query(
+        artist_table.select().where(artist_table.c.Name == "Queen")
+    ),
+    "artist_51": core_query(
+        artist_table.select().where(artist_table.c.ArtistId == 51)
+    ),
+    "albums_of_artist_51": core_query(
+        album_table.select().where(album_table.c.ArtistId == 51)
+    ),
+    "tracks_by_queen": core_query(
+        track_table.select().where(track_table.c.Composer == "Queen")
+    ),
+}
+
+
+# a single-row ORM query as a list of zero or one objects
+def orm_first(query):
+    row = query.first()
+    return [] if row is None else [row]
+
+
+# sql-orm.py: session queries returning mapped objects
+ORM_QUERIES = {
+    "all_artists": lambda session: session.query(Artist).all(),
+    "artist_names": lambda session: [
+        artist.Name for artist in session.query(Artist)
+    ],
+    "artist_queen": lambda session: orm_first(
+        session.query(Artist).filter_by(Name="Queen")
+    ),
+    "artist_51": lambda session: orm_first(
+        session.query(Artist).filter_by(ArtistId=51)
+    ),
+    "albums_of_artist_51": lambda session: (
+        session.query(Album).filter_by(ArtistId=51).all()
+    ),
+    "tracks_by_queen": lambda session: (
+        session.query(Track).filter_by(Composer="Queen").all()
+    ),
+}
+
+
+# every layer runs a query with run() and ends its transaction with
+# reset(), one ROLLBACK round trip each; benchmark() only times run()
+class Psycopg2Layer:
+    name = "psycopg2"
+    queries = PSYCOPG2_QUERIES
+
+    def __init__(self):
+        self.pool = get_raw_pool()
+        self.connection = self.pool.getconn()
+
+    def run(self, query):
+        return query(self.connection)
+
+    def reset(self):
+        self.connection.rollback()
+
+    def close(self):
+        self.pool.putconn(self.connection)
+
+
+class CoreLayer:
+    name = "core"
+    queries = CORE_QUERIES
+
+    def __init__(self):
+        self.connection = db.connect()
+        # an explicit transaction, so reset() can end it like the others
+        self.transaction = self.connection.begin()
+
+    def run(self, query):
+        return query(self.connection)
+
+    def reset(self):
+        self.transaction.rollback()
+        self.transaction = self.connection.begin()
+
+    def close(self):
+        self.transaction.rollback()
+        self.connection.close()
+
+
+class OrmLayer:
+    name = "orm"
+    queries = ORM_QUERIES
+
+    def __init__(self):
+        self.session = sessionmaker(db)()
+
+    def run(self, query):
+        return query(self.session)
+
+    def reset(self):
+        # start every repetition with an empty identity map
+        self.session.expunge_all()
+        self.session.rollback()
+
+    def close(self):
+        self.session.close()
+
+
+LAYERS = {
+    layer.name: layer for layer in (Psycopg2Layer, CoreLayer, OrmLayer)
+}
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * percent / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def benchmark(layer, query_name, warmup=WARMUP, repeat=REPEAT):
+    query = layer.queries[query_name]
+    for _ in range(warmup):
+        layer.run(query)
+        layer.reset()
+
+    latencies = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = layer.run(query)
+        latencies.append(time.perf_counter() - started)
+        layer.reset()
+        rows = len(results)
+
+    # tracemalloc slows everything down, so peak memory gets its own run
+    tracemalloc.start()
+    layer.run(query)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    layer.reset()
+
+    total = sum(latencies)
+    result = {
+        "layer": layer.name,
+        "query": query_name,
+        "rows": rows,
+        "repeat": repeat,
+        "mean_ms": total / repeat * 1000,
+        "min_ms": min(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "rows_per_s": rows * repeat / total if total else 0.0,
+        "peak_memory_bytes": peak,
+    }
+    for percent in PERCENTILES:
+        result["p%d_ms" % percent] = percentile(latencies, percent) * 1000
+    return result
+
+
+def run_suite(layer_names, query_names, warmup=WARMUP, repeat=REPEAT):
+    results = []
+    for layer_name in layer_names:
+        layer = LAYERS[layer_name]()
+        try:
+            for query_name in query_names:
+                results.append(
+                    benchmark(layer, query_name, warmup, repeat)
+                )
+        finally:
+            layer.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the six Chinook queries across access layers"
+    )
+    parser.add_argument(
+        "--layer", action="append", choices=sorted(LAYERS),
+        help="layer to benchmark (repeatable, default: all)"
+    )
+    parser.add_argument(
+        "--query", action="append", choices=QUERY_NAMES,
+        help="query to benchmark (repeatable, default: all)"
+    )
+    parser.add_argument("--warmup", type=int, default=WARMUP)
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument(
+        "--output", help="write the JSON report to this file"
+    )
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    # CHINOOK_TIMING=1 adds per-statement timing (see chinook_timing.py)
+    if os.environ.get("CHINOOK_TIMING"):
+        import chinook_timing
+        chinook_timing.enable()
+
+    results = run_suite(
+        args.layer or list(LAYERS),
+        args.query or QUERY_NAMES,
+        args.warmup,
+        args.repeat
+    )
+    report = {
+        "warmup": args.warmup,
+        "repeat": args.repeat,
+        "results": results,
+        "pools": pool_stats(),
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
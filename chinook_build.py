@@ -0,0 +1,339 @@
+import argparse
+import os
+import re
+import tempfile
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import psycopg2
+
+from chinook_db import DATABASE
+from chinook_load import (
+    SCRIPT_ENCODING, copy_line, drop_tables, iter_statements,
+    parse_create_table, parse_insert
+)
+
+
+# rebuild the database from Chinook_PostgreSql.sql using every core: the
+# script is parsed once into tables, rows, foreign keys and indexes, the
+# rows are spooled to COPY files, then
+#
+#   create       CREATE TABLE statements (with their primary keys)
+#   load         COPY of every spool file, one worker process each
+#   indexes      the IFK_* indexes, in parallel
+#   constraints  the foreign keys, in waves where no two touch one table
+#   analyze      ANALYZE of every table, in parallel
+#
+# the script adds its foreign keys before the INSERTs, which would force
+# the tables to be loaded parent first; deferring them to after the load
+# makes every table independent, so all of them load at once
+
+# rows per spool file; a big table is split so several workers share it
+CHUNK_ROWS = 50000
+
+FOREIGN_KEY_PATTERN = re.compile(
+    r'ALTER TABLE "(?P<table>[^"]+)" ADD CONSTRAINT "(?P<name>[^"]+)"\s+'
+    r'FOREIGN KEY \([^)]*\) REFERENCES "(?P<referenced>[^"]+)"'
+)
+INDEX_PATTERN = re.compile(
+    r'CREATE (?:UNIQUE )?INDEX "(?P<name>[^"]+)" ON "(?P<table>[^"]+)"'
+)
+
+# a statement to run after the load, and the tables it locks
+Deferred = namedtuple("Deferred", ["name", "tables", "sql"])
+# one spool file of rows in COPY text format
+Chunk = namedtuple("Chunk", ["table", "columns", "path", "rows"])
+
+
+class BuildPlan:
+    def __init__(self):
+        self.tables = []
+        self.columns = {}
+        self.create = []
+        self.chunks = []
+        self.foreign_keys = []
+        self.indexes = []
+        self.other = []
+
+    # table -> the tables its foreign keys point at (self references left
+    # out, "Employee"."ReportsTo" points at "Employee")
+    def dependencies(self):
+        graph = dict((table, set()) for table in self.tables)
+        for foreign_key in self.foreign_keys:
+            table, referenced = foreign_key.tables
+            if referenced != table:
+                graph[table].add(referenced)
+        return graph
+
+    # the tables grouped by depth in the graph: level 0 references nothing,
+    # level n only references lower levels; the order the script would need
+    # if the foreign keys were created before the load
+    def levels(self):
+        graph = self.dependencies()
+        depth = {}
+
+        def visit(table, seen=()):
+            if table not in depth:
+                if table in seen:
+                    raise ValueError("foreign key cycle through %s" % table)
+                depth[table] = 1 + max(
+                    [visit(parent, seen + (table,))
+                     for parent in graph[table]] or [-1]
+                )
+            return depth[table]
+
+        levels = defaultdict(list)
+        for table in self.tables:
+            levels[visit(table)].append(table)
+        return [levels[level] for level in sorted(levels)]
+
+
+class Spool:
+    def __init__(self, directory, table, columns, chunk_rows):
+        self.directory = directory
+        self.table = table
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.chunks = []
+        self.file = None
+        self.path = None
+        self.rows = 0
+
+    def add(self, columns, values):
+        if self.file is None:
+            self.path = os.path.join(
+                self.directory, "%s.%d.copy" % (self.table, len(self.chunks))
+            )
+            self.file = open(self.path, "w", encoding="utf-8")
+        row = dict(zip(columns, values))
+        self.file.write(copy_line([row.get(name) for name in self.columns]))
+        self.rows += 1
+        if self.rows >= self.chunk_rows:
+            self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.chunks.append(
+                Chunk(self.table, self.columns, self.path, self.rows)
+            )
+            self.file = None
+            self.rows = 0
+
+
+# read the script once; the rows go to spool files in directory
+def plan_script(path, directory, encoding=SCRIPT_ENCODING,
+                chunk_rows=CHUNK_ROWS):
+    plan = BuildPlan()
+    spools = {}
+    for statement in iter_statements(path, encoding):
+        insert = parse_insert(statement) if statement[:6] == "INSERT" else None
+        if insert is not None:
+            table, columns, values = insert
+            spool = spools.get(table)
+            if spool is None:
+                spool = spools[table] = Spool(
+                    directory, table, plan.columns.get(table, columns),
+                    chunk_rows
+                )
+            spool.add(columns, values)
+            continue
+        table, columns = parse_create_table(statement)
+        if table is not None:
+            plan.tables.append(table)
+            plan.columns[table] = columns
+            plan.create.append(statement)
+            continue
+        match = FOREIGN_KEY_PATTERN.match(statement)
+        if match is not None:
+            plan.foreign_keys.append(Deferred(
+                match.group("name"),
+                (match.group("table"), match.group("referenced")),
+                statement
+            ))
+            continue
+        match = INDEX_PATTERN.match(statement)
+        if match is not None:
+            plan.indexes.append(Deferred(
+                match.group("name"), (match.group("table"),), statement
+            ))
+            continue
+        plan.other.append(statement)
+
+    for spool in spools.values():
+        spool.close()
+        plan.chunks.extend(spool.chunks)
+    # biggest first, so a large table does not start last and run alone
+    plan.chunks.sort(key=lambda chunk: chunk.rows, reverse=True)
+    return plan
+
+
+# split statements into waves in which no two statements lock the same
+# table: two foreign keys on one table, or pointing at one table, would
+# only queue behind each other's SHARE ROW EXCLUSIVE locks
+def waves(statements):
+    result = []
+    for statement in statements:
+        for wave in result:
+            if not any(set(statement.tables) & set(other.tables)
+                       for other in wave):
+                wave.append(statement)
+                break
+        else:
+            result.append([statement])
+    return result
+
+
+# the worker functions run in child processes, each on its own connection
+def connect(database=DATABASE):
+    connection = psycopg2.connect(database=database)
+    connection.autocommit = True
+    return connection
+
+
+def load_chunk(chunk, database=DATABASE):
+    started = time.perf_counter()
+    connection = connect(database)
+    try:
+        column_list = ", ".join('"%s"' % name for name in chunk.columns)
+        with open(chunk.path, encoding="utf-8") as rows:
+            connection.cursor().copy_expert(
+                'COPY "%s" (%s) FROM STDIN' % (chunk.table, column_list),
+                rows
+            )
+    finally:
+        connection.close()
+    return chunk.table, chunk.rows, time.perf_counter() - started
+
+
+def run_statement(name, sql, database=DATABASE):
+    started = time.perf_counter()
+    connection = connect(database)
+    try:
+        connection.cursor().execute(sql)
+    finally:
+        connection.close()
+    return name, time.perf_counter() - started
+
+
+def report(name, seconds, detail=""):
+    print(name, "%.3fs" % seconds, detail, sep=" | ")
+
+
+def build(path, workers=None, drop=False, encoding=SCRIPT_ENCODING,
+          chunk_rows=CHUNK_ROWS, database=DATABASE):
+    workers = workers or os.cpu_count() or 1
+    phases = {}
+
+    with tempfile.TemporaryDirectory(prefix="chinook-build-") as directory:
+        started = time.perf_counter()
+        plan = plan_script(path, directory, encoding, chunk_rows)
+        phases["parse"] = time.perf_counter() - started
+        report("parse", phases["parse"], "%d tables, %d spool files" % (
+            len(plan.tables), len(plan.chunks)
+        ))
+
+        started = time.perf_counter()
+        connection = connect(database)
+        try:
+            cursor = connection.cursor()
+            if drop:
+                drop_tables(cursor)
+            for statement in plan.create + plan.other:
+                cursor.execute(statement)
+        finally:
+            connection.close()
+        phases["create"] = time.perf_counter() - started
+        report("create", phases["create"])
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            started = time.perf_counter()
+            rows = defaultdict(int)
+            for table, count, seconds in executor.map(
+                load_chunk, plan.chunks, [database] * len(plan.chunks)
+            ):
+                rows[table] += count
+            phases["load"] = time.perf_counter() - started
+            total = sum(rows.values())
+            report("load", phases["load"], "%d rows, %.0f rows/s" % (
+                total, total / phases["load"] if phases["load"] else 0.0
+            ))
+
+            # building an index only takes a SHARE lock, they can all run
+            # together, also several on one table
+            started = time.perf_counter()
+            list(executor.map(
+                run_statement,
+                [index.name for index in plan.indexes],
+                [index.sql for index in plan.indexes],
+                [database] * len(plan.indexes)
+            ))
+            phases["indexes"] = time.perf_counter() - started
+            report("indexes", phases["indexes"],
+                   "%d indexes" % len(plan.indexes))
+
+            started = time.perf_counter()
+            constraint_waves = waves(plan.foreign_keys)
+            for wave in constraint_waves:
+                list(executor.map(
+                    run_statement,
+                    [foreign_key.name for foreign_key in wave],
+                    [foreign_key.sql for foreign_key in wave],
+                    [database] * len(wave)
+                ))
+            phases["constraints"] = time.perf_counter() - started
+            report("constraints", phases["constraints"],
+                   "%d foreign keys in %d waves" % (
+                       len(plan.foreign_keys), len(constraint_waves)
+                   ))
+
+            started = time.perf_counter()
+            list(executor.map(
+                run_statement, plan.tables,
+                ['ANALYZE "%s"' % table for table in plan.tables],
+                [database] * len(plan.tables)
+            ))
+            phases["analyze"] = time.perf_counter() - started
+            report("analyze", phases["analyze"])
+
+    report("total", sum(phases.values()), "%d workers" % workers)
+    return phases
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the Chinook database in parallel, adding "
+                    "indexes and foreign keys after the data is loaded"
+    )
+    parser.add_argument("script", nargs="?", default="Chinook_PostgreSql.sql")
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="worker processes (default: one per core)"
+    )
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--encoding", default=SCRIPT_ENCODING)
+    parser.add_argument(
+        "--drop", action="store_true",
+        help="drop the existing Chinook tables before building"
+    )
+    parser.add_argument(
+        "--plan", action="store_true",
+        help="only print the dependency levels and the constraint waves"
+    )
+    args = parser.parse_args()
+
+    if args.plan:
+        with tempfile.TemporaryDirectory() as directory:
+            plan = plan_script(
+                args.script, directory, args.encoding, args.chunk_rows
+            )
+        for level, tables in enumerate(plan.levels()):
+            print("level %d" % level, ", ".join(tables), sep=" | ")
+        for number, wave in enumerate(waves(plan.foreign_keys)):
+            print("wave %d" % number,
+                  ", ".join(foreign_key.name for foreign_key in wave),
+                  sep=" | ")
+    else:
+        build(args.script, args.workers, args.drop, args.encoding,
+              args.chunk_rows)
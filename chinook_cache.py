@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, sessionmaker
+
+from chinook_db import db
+from chinook_models import Album, Artist, Genre, MediaType
+
+
+# seconds a cached row stays valid, per table: genres and media types
+# practically never change, artists and albums only occasionally
+TABLE_TTL = {
+    "Artist": 300,
+    "Album": 300,
+    "Genre": 3600,
+    "MediaType": 3600,
+}
+MAX_ENTRIES = 1024
+
+
+# least recently used cache whose entries also expire after ttl seconds
+class LRUCache:
+    def __init__(self, maxsize=MAX_ENTRIES, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# read-through cache in front of the small catalog tables; rows are kept as
+# plain column tuples, so cached values never belong to a session
+class CatalogCache:
+    def __init__(self, models=(Artist, Album, Genre, MediaType),
+                 session_factory=None, maxsize=MAX_ENTRIES, ttl=None):
+        self.models = dict((model.__tablename__, model) for model in models)
+        self.session_factory = session_factory or sessionmaker(db)
+        ttl = dict(TABLE_TTL, **(ttl or {}))
+        self.caches = dict(
+            (table, LRUCache(maxsize, ttl.get(table, 300)))
+            for table in self.models
+        )
+        self.invalidations = 0
+        # each cache collects its own tables, so several can watch a session
+        self.written_key = "catalog_cache_written_%d" % id(self)
+
+    def _fetch(self, model, filters):
+        session = self.session_factory()
+        try:
+            query = session.query(*[
+                getattr(model, name)
+                for name in model.__table__.columns.keys()
+            ])
+            for name, value in filters:
+                query = query.filter(getattr(model, name) == value)
+            return query.all()
+        finally:
+            session.close()
+
+    # rows of model matching all filters, e.g. find(Artist, Name="Queen")
+    def find(self, model, **filters):
+        table = model.__tablename__
+        key = tuple(sorted(filters.items()))
+        cache = self.caches[table]
+        found, rows = cache.get(key)
+        if not found:
+            rows = self._fetch(model, key)
+            cache.put(key, rows)
+        return rows
+
+    # a single row by primary key, or None
+    def get(self, model, key):
+        primary_key = model.__table__.primary_key.columns.keys()[0]
+        rows = self.find(model, **{primary_key: key})
+        return rows[0] if rows else None
+
+    def invalidate(self, table=None):
+        tables = [table] if table else list(self.caches)
+        for name in tables:
+            if name in self.caches:
+                self.caches[name].clear()
+                self.invalidations += 1
+
+    # invalidate cached tables when a session writes to them; the tables
+    # are collected at flush time and dropped from the cache on commit,
+    # which is when other readers can see the change
+    def watch(self, target=Session):
+        event.listen(target, "after_flush", self._after_flush)
+        event.listen(target, "after_bulk_update", self._after_bulk)
+        event.listen(target, "after_bulk_delete", self._after_bulk)
+        event.listen(target, "after_commit", self._after_commit)
+        event.listen(target, "after_rollback", self._after_rollback)
+        return self
+
+    def _written(self, session):
+        return session.info.setdefault(self.written_key, set())
+
+    def _after_flush(self, session, flush_context):
+        written = self._written(session)
+        for instance in list(session.new) + list(session.dirty) + \
+                list(session.deleted):
+            table = getattr(instance, "__tablename__", None)
+            if table in self.caches:
+                written.add(table)
+
+    def _after_bulk(self, update_context):
+        table = update_context.mapper.local_table.name
+        if table in self.caches:
+            self._written(update_context.session).add(table)
+
+    def _after_commit(self, session):
+        for table in session.info.pop(self.written_key, ()):
+            self.invalidate(table)
+
+    def _after_rollback(self, session):
+        session.info.pop(self.written_key, None)
+
+    def stats(self):
+        return {
+            "invalidations": self.invalidations,
+            "tables": dict(
+                (table, cache.stats())
+                for table, cache in self.caches.items()
+            ),
+        }
+
+
+# shared catalog cache, invalidated by writes from any ORM session
+catalog = CatalogCache().watch()
@@ -0,0 +1,283 @@
+import argparse
+import os
+import sys
+import time
+
+import chinook_schema
+
+STARTED = time.perf_counter()
+
+
+# one entry point for the six queries and the CRUD operations, built for
+# short batch runs:
+#
+# - only the standard library is imported up front; the query commands
+#   then only load psycopg2, and SQLAlchemy is imported by the commands
+#   that use the ORM
+# - nothing runs at import time, and tables are checked (or created) once,
+#   then remembered by chinook_schema.py
+# - --timing prints the startup (from loading this module to the start
+#   of the command), command and total time to stderr
+#
+# e.g. python chinook_cli.py --timing artist-by-name Queen
+
+QUERY_TABLES = ["Artist", "Album", "Track"]
+
+QUERIES = {
+    "artists": ('SELECT * FROM "Artist"', []),
+    "artist-names": ('SELECT "Name" FROM "Artist"', []),
+    "artist-by-name": ('SELECT * FROM "Artist" WHERE "Name" = %s', ["name"]),
+    "artist-by-id": ('SELECT * FROM "Artist" WHERE "ArtistId" = %s', ["id"]),
+    "albums": ('SELECT * FROM "Album" WHERE "ArtistId" = %s', ["artist_id"]),
+    "tracks": ('SELECT * FROM "Track" WHERE "Composer" = %s', ["composer"]),
+}
+
+
+# options a CRUD action cannot do without, by (command, action)
+REQUIRED_OPTIONS = {
+    ("programmers", "add"): ["first_name", "last_name"],
+    ("countries", "add"): ["name"],
+    ("countries", "delete"): ["id"],
+}
+
+
+class MissingTables(Exception):
+    pass
+
+
+def raw_connection():
+    # psycopg2 directly rather than chinook_db.raw_connection(): one
+    # connection per run needs no pool, and chinook_db imports SQLAlchemy
+    import psycopg2
+    return psycopg2.connect(database=chinook_schema.DATABASE)
+
+
+def run_query(args):
+    sql, names = QUERIES[args.command]
+    connection = raw_connection()
+    try:
+        cursor = connection.cursor()
+        missing = chinook_schema.missing_tables(cursor, QUERY_TABLES)
+        if missing:
+            raise MissingTables(
+                "missing tables %s, load the database with chinook_load.py"
+                % ", ".join(missing)
+            )
+        cursor.execute(sql, [getattr(args, name) for name in names])
+        for row in cursor:
+            print(*row, sep=" | ")
+    finally:
+        connection.close()
+
+
+def run_discography(args):
+    from sqlalchemy.orm import sessionmaker
+
+    from chinook_db import db
+    from chinook_models import discography
+
+    session = sessionmaker(db)()
+    try:
+        artist = discography(session, args.artist_id, args.strategy)
+        if artist is None:
+            return
+        print(artist.ArtistId, artist.Name, sep=" | ")
+        for album in artist.albums:
+            print(album.AlbumId, album.Title, len(album.tracks), sep=" | ")
+    finally:
+        session.close()
+
+
+def crud_session():
+    from sqlalchemy.orm import sessionmaker
+
+    from chinook_crud import create_tables
+    from chinook_db import db
+
+    create_tables(db)
+    return sessionmaker(db)()
+
+
+# first and last name, either of which may be NULL
+def full_name(first_name, last_name):
+    return " ".join(name for name in (first_name, last_name) if name)
+
+
+def run_programmers(args):
+    from chinook_crud import (
+        Programmer, delete_programmers, update_genders
+    )
+
+    session = crud_session()
+    try:
+        if args.action == "add":
+            session.add(Programmer(
+                first_name=args.first_name, last_name=args.last_name,
+                gender=args.gender, nationality=args.nationality,
+                famous_for=args.famous_for
+            ))
+            session.commit()
+        elif args.action == "update-genders":
+            print("Programmers updated: ", update_genders(session))
+        elif args.action == "delete":
+            filters = dict(
+                (name, getattr(args, name))
+                for name in ("first_name", "last_name", "nationality")
+                if getattr(args, name) is not None
+            )
+            print("Programmers deleted: ", delete_programmers(
+                session, **filters
+            ))
+        else:
+            for programmer in session.query(Programmer):
+                print(
+                    programmer.id,
+                    full_name(programmer.first_name, programmer.last_name),
+                    programmer.gender,
+                    programmer.nationality,
+                    programmer.famous_for,
+                    sep=" | "
+                )
+    finally:
+        session.close()
+
+
+def run_countries(args):
+    from chinook_crud import FavoriteCountries
+
+    session = crud_session()
+    try:
+        if args.action == "add":
+            session.add(FavoriteCountries(
+                name=args.name, capital=args.capital,
+                population=args.population, famous_for=args.famous_for
+            ))
+            session.commit()
+        elif args.action == "delete":
+            deleted = (
+                session.query(FavoriteCountries)
+                .filter_by(id=args.id)
+                .delete(synchronize_session=False)
+            )
+            session.commit()
+            print("Countries deleted: ", deleted)
+        else:
+            for country in session.query(FavoriteCountries):
+                print(
+                    country.id,
+                    country.name,
+                    country.capital,
+                    country.population,
+                    country.famous_for,
+                    sep=" | "
+                )
+    finally:
+        session.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Run the Chinook queries and CRUD operations"
+    )
+    parser.add_argument(
+        "--timing", action="store_true",
+        default=bool(os.environ.get("CHINOOK_CLI_TIMING")),
+        help="print startup and command time to stderr"
+    )
+    parser.add_argument(
+        "--recheck", action="store_true",
+        help="forget the cached schema check and look again"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("artists", "artist-names"):
+        commands.add_parser(name).set_defaults(run=run_query)
+    command = commands.add_parser("artist-by-name")
+    command.add_argument("name")
+    command.set_defaults(run=run_query)
+    command = commands.add_parser("artist-by-id")
+    command.add_argument("id", type=int)
+    command.set_defaults(run=run_query)
+    command = commands.add_parser("albums")
+    command.add_argument("artist_id", type=int)
+    command.set_defaults(run=run_query)
+    command = commands.add_parser("tracks")
+    command.add_argument("composer")
+    command.set_defaults(run=run_query)
+    command = commands.add_parser("discography")
+    command.add_argument("artist_id", type=int)
+    command.add_argument(
+        "--strategy", choices=["joined", "selectin"], default="selectin"
+    )
+    command.set_defaults(run=run_discography)
+
+    command = commands.add_parser("programmers")
+    command.add_argument(
+        "action", nargs="?", default="list",
+        choices=["list", "add", "update-genders", "delete"]
+    )
+    command.add_argument("--first-name")
+    command.add_argument("--last-name")
+    command.add_argument("--gender")
+    command.add_argument("--nationality")
+    command.add_argument("--famous-for")
+    command.set_defaults(run=run_programmers)
+
+    command = commands.add_parser("countries")
+    command.add_argument(
+        "action", nargs="?", default="list", choices=["list", "add", "delete"]
+    )
+    command.add_argument("--id", type=int)
+    command.add_argument("--name")
+    command.add_argument("--capital")
+    command.add_argument("--population", type=int)
+    command.add_argument("--famous-for")
+    command.set_defaults(run=run_countries)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    required = REQUIRED_OPTIONS.get(
+        (args.command, getattr(args, "action", None)), []
+    )
+    missing = [name for name in required if getattr(args, name) is None]
+    if missing:
+        parser.error("%s %s requires %s" % (
+            args.command, args.action, ", ".join(
+                "--" + name.replace("_", "-") for name in missing
+            )
+        ))
+    # CHINOOK_TIMING=1 adds per-statement timing (see chinook_timing.py);
+    # imported only then, as it loads SQLAlchemy
+    if os.environ.get("CHINOOK_TIMING"):
+        import chinook_timing
+        chinook_timing.enable()
+    if args.recheck:
+        chinook_schema.forget()
+    ready = time.perf_counter()
+    try:
+        args.run(args)
+    except MissingTables as error:
+        print(error, file=sys.stderr)
+        return 1
+    except Exception as error:
+        # undefined_table: a table dropped since it was cached, so check
+        # again on the next run (SQLAlchemy keeps the psycopg2 error in orig)
+        if getattr(getattr(error, "orig", error), "pgcode", None) == "42P01":
+            chinook_schema.forget()
+        raise
+    finished = time.perf_counter()
+    if args.timing:
+        print(
+            "startup %.1f ms" % ((ready - STARTED) * 1000),
+            "command %.1f ms" % ((finished - ready) * 1000),
+            "total %.1f ms" % ((finished - STARTED) * 1000),
+            sep=" | ", file=sys.stderr
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from chinook_db import raw_connection
+
+
+# "customers who bought this track also bought": a sparse track x track
+# matrix counting the baskets (invoices, or customers) holding both tracks,
+# built with NumPy in a batch job and saved as plain .npy arrays in CSR
+# layout, so lookups memory-map the files and never touch PostgreSQL
+#
+# row t of the matrix is indices[indptr[t]:indptr[t + 1]] (the other
+# tracks) with the matching data (the number of shared baskets)
+
+BASKETS = {
+    "invoice": (
+        'SELECT DISTINCT "InvoiceId", "TrackId" FROM "InvoiceLine"'
+    ),
+    "customer": (
+        'SELECT DISTINCT i."CustomerId", il."TrackId" '
+        'FROM "InvoiceLine" il '
+        'JOIN "Invoice" i ON i."InvoiceId" = il."InvoiceId"'
+    ),
+}
+
+# (basket, track) pairs expanded at a time; bounds the memory of the
+# pair arrays, which grow with the square of the basket sizes
+CHUNK_PAIRS = 5000000
+
+DIRECTORY = "copurchase"
+ARRAYS = ["indptr", "indices", "data"]
+
+
+def fetch_baskets(connection, basket="invoice"):
+    cursor = connection.cursor()
+    cursor.execute(BASKETS[basket])
+    rows = np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 2)
+    cursor.close()
+    order = np.lexsort((rows[:, 1], rows[:, 0]))
+    return rows[order, 0], rows[order, 1]
+
+
+# every ordered pair of different tracks sharing a basket, for the baskets
+# from first to last; the baskets must be sorted, one row per track
+def basket_pairs(tracks, starts, sizes):
+    owners = np.repeat(np.arange(len(sizes)), sizes)
+    # each entry is paired with all the entries of its basket
+    left = np.repeat(np.arange(len(owners)), sizes[owners])
+    first = np.repeat(starts[owners] - starts[0], sizes[owners])
+    offsets = np.arange(len(left)) - np.repeat(
+        np.cumsum(sizes[owners]) - sizes[owners], sizes[owners]
+    )
+    right = first + offsets
+    keep = left != right
+    return tracks[left[keep]], tracks[right[keep]]
+
+
+def build(baskets, tracks, chunk_pairs=CHUNK_PAIRS):
+    n_tracks = int(tracks.max()) + 1 if len(tracks) else 0
+    _, starts, sizes = np.unique(
+        baskets, return_index=True, return_counts=True
+    )
+    # chunks of whole baskets, each expanding to about chunk_pairs pairs
+    chunk_of = np.cumsum(sizes.astype(np.int64) ** 2) // chunk_pairs
+    keys = []
+    counts = []
+    for chunk in np.unique(chunk_of):
+        selected = chunk_of == chunk
+        chunk_starts = starts[selected]
+        chunk_sizes = sizes[selected]
+        begin = chunk_starts[0]
+        end = chunk_starts[-1] + chunk_sizes[-1]
+        left, right = basket_pairs(tracks[begin:end], chunk_starts,
+                                   chunk_sizes)
+        chunk_keys, chunk_counts = np.unique(
+            left * n_tracks + right, return_counts=True
+        )
+        keys.append(chunk_keys)
+        counts.append(chunk_counts)
+
+    if keys:
+        merged, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+        data = np.bincount(inverse, weights=np.concatenate(counts))
+    else:
+        merged = np.empty(0, dtype=np.int64)
+        data = np.empty(0)
+    rows = merged // max(n_tracks, 1)
+    indptr = np.zeros(n_tracks + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_tracks), out=indptr[1:])
+    return {
+        "indptr": indptr,
+        "indices": (merged % max(n_tracks, 1)).astype(np.int32),
+        "data": data.astype(np.int32),
+    }
+
+
+def save(matrix, directory=DIRECTORY, **meta):
+    os.makedirs(directory, exist_ok=True)
+    for name in ARRAYS:
+        np.save(os.path.join(directory, name + ".npy"), matrix[name])
+    meta["tracks"] = len(matrix["indptr"]) - 1
+    meta["pairs"] = len(matrix["indices"])
+    with open(os.path.join(directory, "meta.json"), "w") as output:
+        json.dump(meta, output, indent=2)
+
+
+class CoPurchase:
+    def __init__(self, indptr, indices, data, meta=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.meta = meta or {}
+
+    # map the saved arrays instead of reading them, so opening is instant
+    # and the pages are shared by every process using them
+    @classmethod
+    def open(cls, directory=DIRECTORY):
+        arrays = [
+            np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+            for name in ARRAYS
+        ]
+        with open(os.path.join(directory, "meta.json")) as meta:
+            return cls(*arrays, meta=json.load(meta))
+
+    def row(self, track_id):
+        if not 0 <= track_id < len(self.indptr) - 1:
+            return self.indices[:0], self.data[:0]
+        start, end = self.indptr[track_id], self.indptr[track_id + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def count(self, track_id, other_id):
+        indices, data = self.row(track_id)
+        position = np.searchsorted(indices, other_id)
+        if position < len(indices) and indices[position] == other_id:
+            return int(data[position])
+        return 0
+
+    # the k tracks bought together with track_id most often, as
+    # (track id, shared baskets) pairs, ties broken by the lower track id;
+    # rows are short, so sorting the whole row costs about as much as a
+    # partition and keeps ties deterministic
+    def top_k(self, track_id, k=10):
+        indices, data = self.row(track_id)
+        best = np.lexsort((indices, -np.asarray(data)))[:k]
+        return [
+            (int(indices[position]), int(data[position]))
+            for position in best
+        ]
+
+    # tracks bought together with any of track_ids, summed, the tracks
+    # themselves left out (e.g. recommendations for a shopping cart)
+    def top_k_many(self, track_ids, k=10):
+        rows = [self.row(track_id) for track_id in track_ids]
+        if not rows:
+            return []
+        indices = np.concatenate([row[0] for row in rows])
+        data = np.concatenate([row[1] for row in rows])
+        others, inverse = np.unique(indices, return_inverse=True)
+        totals = np.bincount(inverse, weights=data).astype(np.int64)
+        keep = ~np.isin(others, list(track_ids))
+        others, totals = others[keep], totals[keep]
+        best = np.lexsort((others, -totals))[:k]
+        return [(int(others[i]), int(totals[i])) for i in best]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build or query the track co-purchase matrix"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("build", help="build it from InvoiceLine")
+    command.add_argument("--basket", choices=sorted(BASKETS),
+                         default="invoice")
+    command.add_argument("--chunk-pairs", type=int, default=CHUNK_PAIRS)
+    command.add_argument("--output", default=DIRECTORY)
+    command = commands.add_parser("top", help="tracks bought together")
+    command.add_argument("track_id", type=int, nargs="+")
+    command.add_argument("-k", type=int, default=10)
+    command.add_argument("--input", default=DIRECTORY)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        started = time.perf_counter()
+        with raw_connection() as connection:
+            baskets, tracks = fetch_baskets(connection, args.basket)
+        fetched = time.perf_counter()
+        matrix = build(baskets, tracks, args.chunk_pairs)
+        built = time.perf_counter()
+        save(matrix, args.output, basket=args.basket,
+             built_at=time.time())
+        print("fetch", "%d rows" % len(tracks),
+              "%.3fs" % (fetched - started), sep=" | ")
+        print("build", "%d pairs" % len(matrix["indices"]),
+              "%.3fs" % (built - fetched), sep=" | ")
+    else:
+        matrix = CoPurchase.open(args.input)
+        started = time.perf_counter()
+        if len(args.track_id) == 1:
+            hits = matrix.top_k(args.track_id[0], args.k)
+        else:
+            hits = matrix.top_k_many(args.track_id, args.k)
+        elapsed = time.perf_counter() - started
+        for track_id, baskets in hits:
+            print(track_id, baskets, sep=" | ")
+        print("lookup", "%.3f ms" % (elapsed * 1000), sep=" | ")
@@ -0,0 +1,70 @@
+from sqlalchemy import Column, Integer, String, case
+from sqlalchemy.ext.declarative import declarative_base
+
+from chinook_db import db
+from chinook_schema import ensure_schema
+
+
+# the tables of sql-crud.py and sql-newtable.py and their set-based
+# helpers, importable without running those scripts; they live on their
+# own base so that create_all() never touches the Chinook tables
+
+base = declarative_base()
+
+
+# create a class-based model for the "Programmer" table
+class Programmer(base):
+    __tablename__ = "Programmer"
+    id = Column(Integer, primary_key=True)
+    first_name = Column(String)
+    last_name = Column(String)
+    gender = Column(String)
+    nationality = Column(String)
+    famous_for = Column(String)
+
+
+# create a class-based model for the "Favorite Country" table
+class FavoriteCountries(base):
+    __tablename__ = "Favorite Country"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+    capital = Column(String)
+    population = Column(Integer)
+    famous_for = Column(String)
+
+
+# short gender codes and the full names they are updated to
+GENDER_NAMES = {"F": "Female", "M": "Male"}
+
+
+# set-based version of "updating multiple records": a single
+# UPDATE ... SET gender = CASE ... statement and a single commit,
+# instead of one round trip and one commit per programmer
+def update_genders(session, names=GENDER_NAMES):
+    updated = (
+        session.query(Programmer)
+        .filter(Programmer.gender.in_(list(names)))
+        .update(
+            {Programmer.gender: case(names, value=Programmer.gender)},
+            synchronize_session=False
+        )
+    )
+    session.commit()
+    return updated
+
+
+# set-based version of "delete multiple/all records": a single DELETE
+# (optionally filtered, e.g. nationality="British") and a single commit
+def delete_programmers(session, **filters):
+    deleted = (
+        session.query(Programmer)
+        .filter_by(**filters)
+        .delete(synchronize_session=False)
+    )
+    session.commit()
+    return deleted
+
+
+# create the tables unless chinook_schema already saw them
+def create_tables(engine=db):
+    return ensure_schema(engine, base.metadata)
@@ -0,0 +1,253 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from psycopg2.pool import ThreadedConnectionPool
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+
+# one place for every script to get its connections from, so that a worker
+# reuses warm connections instead of opening a new one per unit of work
+
+# the database can be switched with CHINOOK_DATABASE, e.g. for a copy
+DATABASE = os.environ.get("CHINOOK_DATABASE", "chinook")
+DATABASE_URL = "postgresql:///" + DATABASE
+
+# connections kept open in each pool, and extra ones allowed under load
+POOL_SIZE = int(os.environ.get("CHINOOK_POOL_SIZE", 5))
+MAX_OVERFLOW = int(os.environ.get("CHINOOK_MAX_OVERFLOW", 10))
+# seconds to wait for a free connection before giving up
+POOL_TIMEOUT = float(os.environ.get("CHINOOK_POOL_TIMEOUT", 30))
+# seconds after which a connection is replaced instead of reused
+POOL_RECYCLE = int(os.environ.get("CHINOOK_POOL_RECYCLE", 1800))
+
+
+# callables run as listener(pool_name, seconds) after every checkout, with
+# the time spent waiting for the connection (see chinook_timing.py)
+WAIT_LISTENERS = []
+# callables run with every psycopg2 connection handed out by the raw pool
+RAW_CONNECTION_LISTENERS = []
+
+
+def notify_wait(pool_name, seconds):
+    for listener in WAIT_LISTENERS:
+        listener(pool_name, seconds)
+
+
+# QueuePool that also records how long callers waited for a connection
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_count += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            notify_wait("engine", waited)
+
+
+# the SQLAlchemy engine shared by the Core and ORM scripts
+db = create_engine(
+    DATABASE_URL,
+    poolclass=TimedQueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE,
+    pool_pre_ping=True
+)
+
+
+def wait_stats(pool):
+    return {
+        "wait_count": pool.wait_count,
+        "wait_seconds": pool.wait_seconds,
+        "mean_wait_seconds": (
+            pool.wait_seconds / pool.wait_count if pool.wait_count else 0.0
+        ),
+        "max_wait_seconds": pool.max_wait_seconds,
+    }
+
+
+def engine_stats(engine=db):
+    pool = engine.pool
+    stats = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats.update(wait_stats(pool))
+    return stats
+
+
+# ThreadedConnectionPool that records when each of its connections was
+# opened, and forgets it as soon as the pool closes the connection (when it
+# is returned with close=True, or while minconn connections are idle)
+class RecyclingConnectionPool(ThreadedConnectionPool):
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        # filled in by _connect(), which the parent calls minconn times
+        self.created = {}
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def _connect(self, key=None):
+        connection = super()._connect(key)
+        self.created[id(connection)] = time.time()
+        return connection
+
+    def _putconn(self, conn, key=None, close=False):
+        try:
+            super()._putconn(conn, key, close)
+        finally:
+            if conn.closed:
+                self.created.pop(id(conn), None)
+
+    def _closeall(self):
+        super()._closeall()
+        self.created.clear()
+
+
+# psycopg2 pool for the raw path (sql-psycopg2.py): ThreadedConnectionPool
+# raises as soon as it is exhausted, so a semaphore makes callers wait up
+# to POOL_TIMEOUT instead, and connections are pinged and recycled like the
+# SQLAlchemy ones; minconn is how many idle connections it keeps open, any
+# connection returned beyond that is closed
+class RawPool:
+    def __init__(self, minconn=POOL_SIZE, maxconn=POOL_SIZE + MAX_OVERFLOW,
+                 timeout=POOL_TIMEOUT, recycle=POOL_RECYCLE,
+                 pre_ping=True, **connect_kwargs):
+        self.pool = RecyclingConnectionPool(
+            minconn, maxconn, **connect_kwargs
+        )
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.slots = threading.BoundedSemaphore(maxconn)
+        self.lock = threading.Lock()
+        self.checked_out = 0
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _usable(self, connection):
+        if connection.closed:
+            return False
+        if self.recycle >= 0:
+            created = self.pool.created.get(id(connection))
+            if created is None or time.time() - created > self.recycle:
+                return False
+        if self.pre_ping:
+            try:
+                cursor = connection.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+                connection.rollback()
+            except Exception:
+                return False
+        return True
+
+    def getconn(self):
+        started = time.perf_counter()
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError(
+                "no connection available after %.1fs" % self.timeout
+            )
+        try:
+            connection = self.pool.getconn()
+            while not self._usable(connection):
+                self.pool.putconn(connection, close=True)
+                connection = self.pool.getconn()
+        except Exception:
+            self.slots.release()
+            raise
+        waited = time.perf_counter() - started
+        with self.lock:
+            self.checked_out += 1
+            self.wait_count += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        notify_wait("raw", waited)
+        for listener in RAW_CONNECTION_LISTENERS:
+            listener(connection)
+        return connection
+
+    def putconn(self, connection, close=False):
+        self.pool.putconn(connection, close=close)
+        with self.lock:
+            self.checked_out -= 1
+        self.slots.release()
+
+    def closeall(self):
+        self.pool.closeall()
+
+    def stats(self):
+        stats = {
+            # as in engine_stats(): the connections kept open, and those
+            # checked out beyond them
+            "size": self.minconn,
+            "checked_in": len(self.pool._pool),
+            "checked_out": self.checked_out,
+            "overflow": max(self.checked_out - self.minconn, 0),
+        }
+        stats.update(wait_stats(self))
+        return stats
+
+
+_raw_pool = None
+_raw_pool_lock = threading.Lock()
+
+
+# the psycopg2 pool is created on first use, so importing this module from
+# a Core or ORM script never opens a raw connection
+def get_raw_pool():
+    global _raw_pool
+    if _raw_pool is None:
+        with _raw_pool_lock:
+            if _raw_pool is None:
+                _raw_pool = RawPool(minconn=POOL_SIZE, database=DATABASE)
+    return _raw_pool
+
+
+# borrow a pooled psycopg2 connection, committing on success and rolling
+# back on error before it goes back to the pool
+@contextmanager
+def raw_connection():
+    pool = get_raw_pool()
+    connection = pool.getconn()
+    try:
+        yield connection
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        pool.putconn(connection)
+
+
+def pool_stats():
+    stats = {"engine": engine_stats(db)}
+    if _raw_pool is not None:
+        stats["raw"] = _raw_pool.stats()
+    return stats
+
+
+def dispose():
+    global _raw_pool
+    db.dispose()
+    if _raw_pool is not None:
+        _raw_pool.closeall()
+        _raw_pool = None
+
@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from chinook_db import raw_connection
+from chinook_models import base
+
+
+# ship tables to the analytics stack as chunked CSV or Parquet files: rows
+# stream from COPY ... TO STDOUT (CSV) or a server-side cursor (Parquet) into
+# part files of at most CHUNK_ROWS rows, so memory stays bounded whatever
+# the table size
+#
+# incremental exports remember the sort key of the last exported row in a
+# state file and only export rows after it; the key ends with the primary
+# key so it is unique, e.g. ("InvoiceDate", "InvoiceId")
+
+CHUNK_ROWS = 100000
+FORMATS = ["csv", "parquet"]
+STATE_FILE = "export-state.json"
+
+# the key used by incremental exports, per table; other tables use their
+# primary key
+EXPORT_KEYS = {
+    "Track": ("TrackId",),
+    "Invoice": ("InvoiceDate", "InvoiceId"),
+    "InvoiceLine": ("InvoiceLineId",),
+}
+
+
+def export_key(table):
+    if table in EXPORT_KEYS:
+        return EXPORT_KEYS[table]
+    return tuple(base.metadata.tables[table].primary_key.columns.keys())
+
+
+def table_columns(cursor, table):
+    cursor.execute('SELECT * FROM "%s" LIMIT 0' % table)
+    return [description[0] for description in cursor.description]
+
+
+def quote_list(names):
+    return ", ".join('"%s"' % name for name in names)
+
+
+# the SELECT of one export: rows after the last exported key, up to the
+# newest key at the start of the export, in key order
+def export_sql(cursor, table, columns, key, after=None, upto=None):
+    sql = 'SELECT %s FROM "%s"' % (quote_list(columns), table)
+    conditions = []
+    params = []
+    placeholders = ", ".join(["%s"] * len(key))
+    if after is not None:
+        conditions.append("(%s) > (%s)" % (quote_list(key), placeholders))
+        params.extend(after)
+    if upto is not None:
+        conditions.append("(%s) <= (%s)" % (quote_list(key), placeholders))
+        params.extend(upto)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY %s" % quote_list(key)
+    return cursor.mogrify(sql, params).decode()
+
+
+def newest_key(cursor, table, key):
+    cursor.execute('SELECT %s FROM "%s" ORDER BY %s LIMIT 1' % (
+        quote_list(key), table,
+        ", ".join('"%s" DESC' % name for name in key)
+    ))
+    row = cursor.fetchone()
+    return None if row is None else [
+        value.isoformat() if hasattr(value, "isoformat") else value
+        for value in row
+    ]
+
+
+def part_path(directory, table, stamp, number, extension):
+    return os.path.join(
+        directory, table, "%s-%s-%05d.%s" % (table, stamp, number, extension)
+    )
+
+
+# file object for copy_expert: psycopg2 writes one row per write() call, so
+# counting calls is counting rows; a new part file starts every chunk_rows
+#
+# this is not an io.TextIOBase, so psycopg2 hands over bytes (UTF-8, see
+# export_csv) and the parts are written in binary mode
+class CsvParts:
+    def __init__(self, directory, table, stamp, columns, chunk_rows):
+        self.directory = directory
+        self.table = table
+        self.stamp = stamp
+        self.header = (",".join(columns) + "\n").encode("utf-8")
+        self.chunk_rows = chunk_rows
+        self.paths = []
+        self.file = None
+        self.rows = 0
+        self.pending = 0
+
+    def write(self, data):
+        if self.file is None:
+            path = part_path(
+                self.directory, self.table, self.stamp, len(self.paths), "csv"
+            )
+            self.file = open(path, "wb")
+            self.file.write(self.header)
+            self.paths.append(path)
+        self.file.write(data)
+        self.rows += 1
+        self.pending += 1
+        if self.pending >= self.chunk_rows:
+            self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.pending = 0
+
+
+def export_csv(cursor, sql, directory, table, stamp, columns, chunk_rows):
+    parts = CsvParts(directory, table, stamp, columns, chunk_rows)
+    try:
+        cursor.copy_expert(
+            "COPY (%s) TO STDOUT WITH (FORMAT csv, ENCODING 'UTF8')" % sql,
+            parts
+        )
+    finally:
+        parts.close()
+    return parts.rows, parts.paths
+
+
+# PostgreSQL type oids of cursor.description and the pyarrow type factory
+# for each; numeric and timestamps are handled in arrow_type()
+ARROW_TYPES = {
+    16: "bool_",
+    17: "binary",
+    20: "int64",
+    21: "int16",
+    23: "int32",
+    25: "string",
+    700: "float32",
+    701: "float64",
+    1042: "string",
+    1043: "string",
+    1082: "date32",
+}
+
+
+def arrow_type(pyarrow, column, values):
+    if column.type_code == 1700 and column.precision:
+        return pyarrow.decimal128(column.precision, column.scale or 0)
+    if column.type_code == 1114:
+        return pyarrow.timestamp("us")
+    if column.type_code == 1184:
+        return pyarrow.timestamp("us", tz="UTC")
+    if column.type_code in ARROW_TYPES:
+        return getattr(pyarrow, ARROW_TYPES[column.type_code])()
+    # any other type as inferred from the first batch, text when all NULL
+    inferred = pyarrow.array(values).type
+    return pyarrow.string() if pyarrow.types.is_null(inferred) else inferred
+
+
+# one schema for every part of an export, from the column types rather than
+# each batch's values, so a chunk where a column is all NULL still matches
+def parquet_schema(pyarrow, description, columns, batch):
+    return pyarrow.schema([
+        (name, arrow_type(pyarrow, column, [row[index] for row in batch]))
+        for index, (name, column) in enumerate(zip(columns, description))
+    ])
+
+
+def export_parquet(connection, sql, directory, table, stamp, columns,
+                   chunk_rows):
+    # pyarrow is only needed for Parquet, CSV exports work without it
+    import pyarrow
+    import pyarrow.parquet
+
+    cursor = connection.cursor("export_%s" % table.lower())
+    cursor.itersize = chunk_rows
+    cursor.execute(sql)
+    rows = 0
+    paths = []
+    schema = None
+    while True:
+        batch = cursor.fetchmany(chunk_rows)
+        if not batch:
+            break
+        if schema is None:
+            # a named cursor only has its description after the first fetch
+            schema = parquet_schema(
+                pyarrow, cursor.description, columns, batch
+            )
+        path = part_path(directory, table, stamp, len(paths), "parquet")
+        pyarrow.parquet.write_table(
+            pyarrow.Table.from_pydict(dict(
+                (name, [row[index] for row in batch])
+                for index, name in enumerate(columns)
+            ), schema=schema),
+            path
+        )
+        paths.append(path)
+        rows += len(batch)
+    cursor.close()
+    return rows, paths
+
+
+# export one table; runs in a worker process when exporting in parallel
+def export_table(table, directory, file_format="csv", after=None,
+                 chunk_rows=CHUNK_ROWS):
+    key = export_key(table)
+    started = time.perf_counter()
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S")
+    os.makedirs(os.path.join(directory, table), exist_ok=True)
+
+    with raw_connection() as connection:
+        cursor = connection.cursor()
+        # one snapshot for the newest key and the rows, so rows committed
+        # during the export are left for the next one
+        cursor.execute(
+            "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+        )
+        columns = table_columns(cursor, table)
+        upto = newest_key(cursor, table, key)
+        if upto is None or (after is not None and list(after) == upto):
+            rows, paths = 0, []
+        else:
+            sql = export_sql(cursor, table, columns, key, after, upto)
+            if file_format == "parquet":
+                rows, paths = export_parquet(
+                    connection, sql, directory, table, stamp, columns,
+                    chunk_rows
+                )
+            else:
+                rows, paths = export_csv(
+                    cursor, sql, directory, table, stamp, columns, chunk_rows
+                )
+        connection.rollback()
+
+    return {
+        "table": table,
+        "rows": rows,
+        "files": paths,
+        "seconds": time.perf_counter() - started,
+        "key": list(key),
+        "last": upto if upto is not None else after,
+    }
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as state:
+        return json.load(state)
+
+
+def save_state(path, state):
+    with open(path + ".tmp", "w") as output:
+        json.dump(state, output, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+# export several tables, in parallel when workers > 1; with incremental
+# set, only the rows after the last export recorded in the state file
+def export(tables, directory, file_format="csv", incremental=False,
+           workers=1, chunk_rows=CHUNK_ROWS, state_path=None):
+    state_path = state_path or os.path.join(directory, STATE_FILE)
+    state = load_state(state_path) if incremental else {}
+    after = {}
+    for table in tables:
+        saved = state.get(table)
+        key = export_key(table)
+        # a saved key from a different sort order cannot be resumed
+        if saved is not None and saved["key"] == list(key):
+            after[table] = saved["last"]
+        else:
+            after[table] = None
+
+    arguments = [
+        (table, directory, file_format, after[table], chunk_rows)
+        for table in tables
+    ]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(export_table, *zip(*arguments)))
+    else:
+        results = [export_table(*argument) for argument in arguments]
+
+    state = load_state(state_path)
+    for result in results:
+        if result["last"] is not None:
+            state[result["table"]] = {
+                "key": result["key"], "last": result["last"]
+            }
+    os.makedirs(directory, exist_ok=True)
+    save_state(state_path, state)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export Chinook tables to chunked CSV or Parquet files"
+    )
+    parser.add_argument(
+        "tables", nargs="*", default=sorted(EXPORT_KEYS),
+        help="tables to export (default: %s)" % ", ".join(sorted(EXPORT_KEYS))
+    )
+    parser.add_argument("--output", default="export")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="tables exported at the same time"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="only export rows added since the last export"
+    )
+    args = parser.parse_args()
+
+    for result in export(args.tables, args.output, args.format,
+                         args.incremental, args.workers, args.chunk_rows):
+        print(
+            result["table"],
+            "%d rows" % result["rows"],
+            "%d files" % len(result["files"]),
+            "%.3fs" % result["seconds"],
+            sep=" | "
+        )
@@ -0,0 +1,299 @@
+import argparse
+import io
+import time
+from datetime import timedelta
+
+import numpy as np
+
+from chinook_db import raw_connection
+from chinook_load import copy_line
+from chinook_partition import create_partitions, is_partitioned
+
+
+# grows the sample Chinook data to a chosen scale factor: scale 10 adds
+# nine more copies' worth of artists, albums, tracks, customers, invoices
+# and playlists, with new ids after the existing ones, so every foreign key
+# points at a row that exists (the sample ids run 1..N without gaps)
+#
+# popularity is skewed the way real catalogs are: a few tracks get most of
+# the purchases and playlist entries, a few customers most of the invoices,
+# and playlist sizes follow a long-tailed distribution
+
+BATCH_SIZE = 10000
+
+# rows per scale factor unit, taken from the sample data
+BASE_ROWS = {
+    "Artist": 275,
+    "Album": 347,
+    "Track": 3503,
+    "Customer": 59,
+    "Invoice": 412,
+    "Playlist": 18,
+}
+LINES_PER_INVOICE = 5.4
+TRACKS_PER_PLAYLIST = 480
+# exponent of the Zipf-like popularity curves
+SKEW = 1.1
+
+# new invoices are spread over this many days after the latest one
+INVOICE_DAYS = 365 * 5
+SUPPORT_REPS = [3, 4, 5]
+COUNTRIES = [
+    "USA", "Canada", "France", "Brazil", "Germany", "United Kingdom",
+    "Czech Republic", "Portugal", "India", "Chile", "Ireland", "Hungary",
+    "Austria", "Finland", "Netherlands", "Norway", "Sweden", "Spain",
+    "Poland", "Italy", "Denmark", "Australia", "Argentina", "Belgium",
+]
+
+
+def zipf_weights(count, skew=SKEW, rng=None):
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    if rng is not None:
+        # shuffle, so that popularity does not follow the id order
+        rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+# draw size ids from first..first+count-1, following the weights
+def skewed_ids(rng, weights, size, first=1):
+    cumulative = np.cumsum(weights)
+    picks = np.searchsorted(cumulative, rng.random(size) * cumulative[-1])
+    return np.minimum(picks, len(weights) - 1) + first
+
+
+def table_max(cursor, table, column):
+    cursor.execute('SELECT COALESCE(MAX("%s"), 0) FROM "%s"' % (column, table))
+    return cursor.fetchone()[0]
+
+
+# COPY column arrays into a table, BATCH_SIZE rows at a time
+def copy_columns(cursor, table, columns, batch_size=BATCH_SIZE):
+    names = list(columns)
+    arrays = [columns[name] for name in names]
+    total = len(arrays[0])
+    column_list = ", ".join('"%s"' % name for name in names)
+    started = time.perf_counter()
+    for start in range(0, total, batch_size):
+        chunk = [
+            array[start:start + batch_size].tolist() for array in arrays
+        ]
+        buffer = io.StringIO()
+        for row in zip(*chunk):
+            buffer.write(copy_line([
+                None if value is None else str(value) for value in row
+            ]))
+        buffer.seek(0)
+        cursor.copy_expert(
+            'COPY "%s" (%s) FROM STDIN' % (table, column_list), buffer
+        )
+    elapsed = time.perf_counter() - started
+    print(
+        table,
+        "%d rows" % total,
+        "%.3fs" % elapsed,
+        "%.0f rows/s" % (total / elapsed if elapsed else 0.0),
+        sep=" | "
+    )
+    return total
+
+
+def labels(prefix, ids):
+    return np.array(["%s %d" % (prefix, value) for value in ids], dtype=object)
+
+
+def generate(connection, scale, seed=0, batch_size=BATCH_SIZE):
+    rng = np.random.default_rng(seed)
+    cursor = connection.cursor()
+    extra = scale - 1
+    if extra <= 0:
+        return {}
+
+    first = {
+        "Artist": table_max(cursor, "Artist", "ArtistId") + 1,
+        "Album": table_max(cursor, "Album", "AlbumId") + 1,
+        "Track": table_max(cursor, "Track", "TrackId") + 1,
+        "Customer": table_max(cursor, "Customer", "CustomerId") + 1,
+        "Invoice": table_max(cursor, "Invoice", "InvoiceId") + 1,
+        "InvoiceLine": table_max(cursor, "InvoiceLine", "InvoiceLineId") + 1,
+        "Playlist": table_max(cursor, "Playlist", "PlaylistId") + 1,
+    }
+    counts = dict(
+        (table, rows * extra) for table, rows in BASE_ROWS.items()
+    )
+    # total rows, existing plus new, that references can point at
+    totals = dict(
+        (table, first[table] - 1 + counts[table]) for table in counts
+    )
+    written = {}
+
+    # Artist
+    artist_ids = np.arange(first["Artist"], totals["Artist"] + 1)
+    written["Artist"] = copy_columns(cursor, "Artist", {
+        "ArtistId": artist_ids,
+        "Name": labels("Artist", artist_ids),
+    }, batch_size)
+
+    # Album: a few prolific artists release most albums
+    album_ids = np.arange(first["Album"], totals["Album"] + 1)
+    written["Album"] = copy_columns(cursor, "Album", {
+        "AlbumId": album_ids,
+        "Title": labels("Album", album_ids),
+        "ArtistId": skewed_ids(
+            rng, zipf_weights(totals["Artist"], 0.8, rng), len(album_ids)
+        ),
+    }, batch_size)
+
+    # Track
+    track_ids = np.arange(first["Track"], totals["Track"] + 1)
+    size = len(track_ids)
+    media_types = skewed_ids(rng, zipf_weights(5, 2.0), size)
+    milliseconds = rng.lognormal(np.log(250000), 0.5, size).astype(np.int64)
+    composers = labels("Composer", rng.integers(1, totals["Artist"], size))
+    composers[rng.random(size) < 0.3] = None
+    written["Track"] = copy_columns(cursor, "Track", {
+        "TrackId": track_ids,
+        "Name": labels("Track", track_ids),
+        "AlbumId": rng.integers(1, totals["Album"] + 1, size),
+        "MediaTypeId": media_types,
+        "GenreId": skewed_ids(rng, zipf_weights(25, 1.5), size),
+        "Composer": composers,
+        "Milliseconds": milliseconds,
+        "Bytes": milliseconds * rng.integers(16, 48, size),
+        # media type 3 is the protected video format, priced higher
+        "UnitPrice": np.where(media_types == 3, "1.99", "0.99"),
+    }, batch_size)
+
+    # Customer
+    customer_ids = np.arange(first["Customer"], totals["Customer"] + 1)
+    size = len(customer_ids)
+    written["Customer"] = copy_columns(cursor, "Customer", {
+        "CustomerId": customer_ids,
+        "FirstName": labels("First", customer_ids),
+        "LastName": labels("Last", customer_ids),
+        "Country": np.array(COUNTRIES, dtype=object)[
+            skewed_ids(rng, zipf_weights(len(COUNTRIES)), size, 0)
+        ],
+        "Email": np.array(
+            ["customer%d@example.com" % value for value in customer_ids],
+            dtype=object
+        ),
+        "SupportRepId": rng.choice(SUPPORT_REPS, size),
+    }, batch_size)
+
+    # InvoiceLine first in memory, so every Invoice total matches its lines;
+    # a few loyal customers place most of the invoices, a few hit tracks
+    # get most of the purchases
+    invoice_ids = np.arange(first["Invoice"], totals["Invoice"] + 1)
+    invoice_count = len(invoice_ids)
+    lines_per_invoice = 1 + rng.poisson(LINES_PER_INVOICE - 1, invoice_count)
+    line_invoices = np.repeat(invoice_ids, lines_per_invoice)
+    line_count = len(line_invoices)
+    line_tracks = skewed_ids(
+        rng, zipf_weights(totals["Track"], SKEW, rng), line_count
+    )
+    cursor.execute('SELECT "TrackId", "UnitPrice" FROM "Track"')
+    prices = np.zeros(totals["Track"] + 1)
+    for track_id, price in cursor.fetchall():
+        prices[track_id] = float(price)
+    line_prices = prices[line_tracks]
+    line_quantities = np.ones(line_count, dtype=np.int64)
+    invoice_totals = np.bincount(
+        line_invoices - first["Invoice"],
+        weights=line_prices * line_quantities,
+        minlength=invoice_count
+    )
+
+    # invoice dates increase with the invoice id, like the sample data
+    cursor.execute(
+        'SELECT COALESCE(MAX("InvoiceDate"), \'2009-01-01\') FROM "Invoice"'
+    )
+    latest = cursor.fetchone()[0]
+    offsets = np.sort(rng.integers(1, INVOICE_DAYS + 1, invoice_count))
+    invoice_dates = np.array([
+        (latest + timedelta(days=int(day))).strftime("%Y-%m-%d")
+        for day in offsets
+    ], dtype=object)
+    # partitioned invoices (chinook_partition.py) need their months first,
+    # and every invoice line carries its invoice's date
+    partitioned = is_partitioned(cursor, "Invoice")
+    if partitioned:
+        create_partitions(
+            cursor, latest, latest + timedelta(days=INVOICE_DAYS)
+        )
+    written["Invoice"] = copy_columns(cursor, "Invoice", {
+        "InvoiceId": invoice_ids,
+        "CustomerId": skewed_ids(
+            rng, zipf_weights(totals["Customer"], 0.7, rng), invoice_count
+        ),
+        "InvoiceDate": invoice_dates,
+        "BillingCountry": np.array(COUNTRIES, dtype=object)[
+            skewed_ids(rng, zipf_weights(len(COUNTRIES)), invoice_count, 0)
+        ],
+        "Total": np.array(
+            ["%.2f" % total for total in invoice_totals], dtype=object
+        ),
+    }, batch_size)
+
+    line_columns = {
+        "InvoiceLineId": np.arange(
+            first["InvoiceLine"], first["InvoiceLine"] + line_count
+        ),
+        "InvoiceId": line_invoices,
+        "TrackId": line_tracks,
+        "UnitPrice": np.array(
+            ["%.2f" % price for price in line_prices], dtype=object
+        ),
+        "Quantity": line_quantities,
+    }
+    if partitioned:
+        line_columns["InvoiceDate"] = (
+            invoice_dates[line_invoices - first["Invoice"]]
+        )
+    written["InvoiceLine"] = copy_columns(
+        cursor, "InvoiceLine", line_columns, batch_size
+    )
+
+    # Playlist, with long-tailed sizes and popular tracks on many lists
+    playlist_ids = np.arange(first["Playlist"], totals["Playlist"] + 1)
+    written["Playlist"] = copy_columns(cursor, "Playlist", {
+        "PlaylistId": playlist_ids,
+        "Name": labels("Playlist", playlist_ids),
+    }, batch_size)
+
+    sizes = rng.lognormal(
+        np.log(TRACKS_PER_PLAYLIST) - 0.5, 1.0, len(playlist_ids)
+    ).astype(np.int64)
+    sizes = np.clip(sizes, 1, totals["Track"])
+    track_weights = zipf_weights(totals["Track"], 0.9, rng)
+    playlist_column = []
+    track_column = []
+    for playlist_id, playlist_size in zip(playlist_ids, sizes):
+        # drawn with replacement, duplicates dropped to keep the key unique
+        tracks = np.unique(skewed_ids(rng, track_weights, playlist_size))
+        playlist_column.append(np.full(len(tracks), playlist_id))
+        track_column.append(tracks)
+    written["PlaylistTrack"] = copy_columns(cursor, "PlaylistTrack", {
+        "PlaylistId": np.concatenate(playlist_column),
+        "TrackId": np.concatenate(track_column),
+    }, batch_size)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Grow the Chinook sample data to a scale factor"
+    )
+    parser.add_argument("scale", type=int, help="e.g. 10, 100 or 1000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with raw_connection() as connection:
+        written = generate(connection, args.scale, args.seed, args.batch_size)
+    print(
+        "total",
+        "%d rows" % sum(written.values()),
+        "%.3fs" % (time.perf_counter() - started),
+        sep=" | "
+    )
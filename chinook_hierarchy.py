@@ -0,0 +1,230 @@
+import argparse
+
+from chinook_db import raw_connection
+
+
+# closure table of the "Employee"."ReportsTo" tree: one row per (ancestor,
+# descendant) pair, every employee also being its own ancestor at depth 0,
+# so "everyone under this manager" is a plain indexed join instead of a
+# recursive walk
+#
+# install() adds triggers that keep the table in sync with inserts,
+# deletes and "ReportsTo" changes on "Employee"; refresh() rebuilds it
+# from scratch, e.g. after a bulk load with the triggers disabled
+
+CREATE_CLOSURE = '''
+CREATE TABLE IF NOT EXISTS "EmployeeClosure"
+(
+    "AncestorId" INT NOT NULL,
+    "DescendantId" INT NOT NULL,
+    "Depth" INT NOT NULL,
+    CONSTRAINT "PK_EmployeeClosure" PRIMARY KEY ("AncestorId", "DescendantId")
+);
+CREATE INDEX IF NOT EXISTS "IX_EmployeeClosureDescendantId"
+    ON "EmployeeClosure" ("DescendantId", "Depth")
+'''
+
+REBUILD_CLOSURE = '''
+INSERT INTO "EmployeeClosure" ("AncestorId", "DescendantId", "Depth")
+WITH RECURSIVE closure ("AncestorId", "DescendantId", "Depth") AS (
+    SELECT "EmployeeId", "EmployeeId", 0 FROM "Employee"
+    UNION ALL
+    SELECT c."AncestorId", e."EmployeeId", c."Depth" + 1
+    FROM closure c
+    JOIN "Employee" e ON e."ReportsTo" = c."DescendantId"
+)
+SELECT "AncestorId", "DescendantId", "Depth" FROM closure
+'''
+
+# moving an employee moves their whole subtree: the links from the old
+# ancestors to the subtree are removed, then every new ancestor is linked
+# to every member of the subtree
+CREATE_TRIGGERS = '''
+CREATE OR REPLACE FUNCTION "EmployeeClosureSync"() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO "EmployeeClosure" ("AncestorId", "DescendantId", "Depth")
+        SELECT "AncestorId", NEW."EmployeeId", "Depth" + 1
+        FROM "EmployeeClosure" WHERE "DescendantId" = NEW."ReportsTo"
+        UNION ALL
+        SELECT NEW."EmployeeId", NEW."EmployeeId", 0;
+        RETURN NEW;
+    ELSIF TG_OP = 'DELETE' THEN
+        DELETE FROM "EmployeeClosure"
+        WHERE "DescendantId" = OLD."EmployeeId"
+           OR "AncestorId" = OLD."EmployeeId";
+        RETURN OLD;
+    END IF;
+
+    IF NEW."ReportsTo" IS NOT DISTINCT FROM OLD."ReportsTo" THEN
+        RETURN NEW;
+    END IF;
+    IF EXISTS (
+        SELECT 1 FROM "EmployeeClosure"
+        WHERE "AncestorId" = NEW."EmployeeId"
+          AND "DescendantId" = NEW."ReportsTo"
+    ) THEN
+        RAISE EXCEPTION 'employee % cannot report to %, who reports to them',
+            NEW."EmployeeId", NEW."ReportsTo";
+    END IF;
+    DELETE FROM "EmployeeClosure" link
+    USING "EmployeeClosure" subtree, "EmployeeClosure" above
+    WHERE subtree."AncestorId" = NEW."EmployeeId"
+      AND above."DescendantId" = NEW."EmployeeId" AND above."Depth" > 0
+      AND link."DescendantId" = subtree."DescendantId"
+      AND link."AncestorId" = above."AncestorId";
+    INSERT INTO "EmployeeClosure" ("AncestorId", "DescendantId", "Depth")
+    SELECT above."AncestorId", subtree."DescendantId",
+           above."Depth" + subtree."Depth" + 1
+    FROM "EmployeeClosure" above, "EmployeeClosure" subtree
+    WHERE above."DescendantId" = NEW."ReportsTo"
+      AND subtree."AncestorId" = NEW."EmployeeId";
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS "TR_EmployeeClosure" ON "Employee";
+CREATE TRIGGER "TR_EmployeeClosure"
+    AFTER INSERT OR DELETE OR UPDATE OF "ReportsTo" ON "Employee"
+    FOR EACH ROW EXECUTE FUNCTION "EmployeeClosureSync"()
+'''
+
+
+# rebuild the closure table from "Employee" in one transaction
+def refresh(connection):
+    cursor = connection.cursor()
+    cursor.execute(CREATE_CLOSURE)
+    cursor.execute('LOCK TABLE "EmployeeClosure" IN EXCLUSIVE MODE')
+    cursor.execute('TRUNCATE "EmployeeClosure"')
+    cursor.execute(REBUILD_CLOSURE)
+    rows = cursor.rowcount
+    cursor.execute('ANALYZE "EmployeeClosure"')
+    connection.commit()
+    return rows
+
+
+def install(connection):
+    cursor = connection.cursor()
+    cursor.execute(CREATE_CLOSURE)
+    cursor.execute(CREATE_TRIGGERS)
+    connection.commit()
+    return refresh(connection)
+
+
+def uninstall(connection):
+    cursor = connection.cursor()
+    cursor.execute('DROP TRIGGER IF EXISTS "TR_EmployeeClosure" '
+                   'ON "Employee"')
+    cursor.execute('DROP FUNCTION IF EXISTS "EmployeeClosureSync"()')
+    cursor.execute('DROP TABLE IF EXISTS "EmployeeClosure"')
+    connection.commit()
+
+
+def _fetch(connection, sql, params=None):
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+# everyone under a manager as (EmployeeId, FirstName, LastName, Depth),
+# the manager included at depth 0 unless include_self is False
+def subtree(connection, employee_id, max_depth=None, include_self=True):
+    return _fetch(
+        connection,
+        'SELECT e."EmployeeId", e."FirstName", e."LastName", c."Depth" '
+        'FROM "EmployeeClosure" c '
+        'JOIN "Employee" e ON e."EmployeeId" = c."DescendantId" '
+        'WHERE c."AncestorId" = %(id)s AND c."Depth" >= %(min)s '
+        'AND (%(max)s::int IS NULL OR c."Depth" <= %(max)s) '
+        'ORDER BY c."Depth", e."EmployeeId"',
+        {"id": employee_id, "min": 0 if include_self else 1,
+         "max": max_depth}
+    )
+
+
+# the chain of managers above an employee, nearest first
+def ancestors(connection, employee_id):
+    return _fetch(
+        connection,
+        'SELECT e."EmployeeId", e."FirstName", e."LastName", c."Depth" '
+        'FROM "EmployeeClosure" c '
+        'JOIN "Employee" e ON e."EmployeeId" = c."AncestorId" '
+        'WHERE c."DescendantId" = %s AND c."Depth" > 0 '
+        'ORDER BY c."Depth"',
+        [employee_id]
+    )
+
+
+def is_under(connection, employee_id, manager_id):
+    return bool(_fetch(
+        connection,
+        'SELECT 1 FROM "EmployeeClosure" '
+        'WHERE "AncestorId" = %s AND "DescendantId" = %s AND "Depth" > 0',
+        [manager_id, employee_id]
+    ))
+
+
+# customers whose support rep is the manager or anyone under them
+def customers_under(connection, manager_id):
+    return _fetch(
+        connection,
+        'SELECT cu."CustomerId", cu."FirstName", cu."LastName", '
+        'cu."SupportRepId" '
+        'FROM "EmployeeClosure" c '
+        'JOIN "Customer" cu ON cu."SupportRepId" = c."DescendantId" '
+        'WHERE c."AncestorId" = %s '
+        'ORDER BY cu."CustomerId"',
+        [manager_id]
+    )
+
+
+# revenue of the customers supported under each direct report of a
+# manager (and the manager's own customers), largest first
+def sales_under(connection, manager_id):
+    return _fetch(
+        connection,
+        'SELECT branch."DescendantId", e."FirstName", e."LastName", '
+        'COALESCE(SUM(i."Total"), 0), COUNT(i."InvoiceId") '
+        'FROM "EmployeeClosure" branch '
+        'JOIN "Employee" e ON e."EmployeeId" = branch."DescendantId" '
+        'JOIN "EmployeeClosure" c ON c."AncestorId" = branch."DescendantId" '
+        'JOIN "Customer" cu ON cu."SupportRepId" = c."DescendantId" '
+        'LEFT JOIN "Invoice" i ON i."CustomerId" = cu."CustomerId" '
+        'WHERE branch."AncestorId" = %(id)s '
+        'AND (branch."Depth" = 1 OR (branch."Depth" = 0 '
+        'AND c."DescendantId" = %(id)s)) '
+        'GROUP BY branch."DescendantId", e."FirstName", e."LastName" '
+        'ORDER BY 4 DESC',
+        {"id": manager_id}
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Maintain and query the Employee closure table"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("install", help="create the table and triggers")
+    commands.add_parser("refresh", help="rebuild the table from Employee")
+    commands.add_parser("uninstall", help="drop the table and triggers")
+    for name in ("subtree", "ancestors", "customers", "sales"):
+        command = commands.add_parser(name)
+        command.add_argument("employee_id", type=int)
+    args = parser.parse_args()
+
+    with raw_connection() as connection:
+        if args.command == "install":
+            print("%d closure rows" % install(connection))
+        elif args.command == "refresh":
+            print("%d closure rows" % refresh(connection))
+        elif args.command == "uninstall":
+            uninstall(connection)
+        else:
+            rows = {
+                "subtree": subtree,
+                "ancestors": ancestors,
+                "customers": customers_under,
+                "sales": sales_under,
+            }[args.command](connection, args.employee_id)
+            for row in rows:
+                print(*row, sep=" | ")
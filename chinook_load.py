@@ -0,0 +1,258 @@
+import argparse
+import io
+import re
+import time
+
+from chinook_db import raw_connection
+
+
+# the Chinook script ships as ISO-8859-1, not UTF-8
+SCRIPT_ENCODING = "latin-1"
+
+# rows buffered per table before they are pushed through one COPY
+BATCH_SIZE = 10000
+
+CHINOOK_TABLES = [
+    "Album", "Artist", "Customer", "Employee", "Genre", "Invoice",
+    "InvoiceLine", "MediaType", "Playlist", "PlaylistTrack", "Track"
+]
+
+INSERT_PATTERN = re.compile(
+    r'INSERT INTO "(?P<table>[^"]+)" \((?P<columns>[^)]*)\) '
+    r'VALUES \((?P<values>.*)\);\s*$',
+    re.DOTALL
+)
+CREATE_TABLE_PATTERN = re.compile(
+    r'CREATE TABLE "(?P<table>[^"]+)"\s*\((?P<body>.*)\);\s*$', re.DOTALL
+)
+COLUMN_PATTERN = re.compile(r'^\s*"(?P<column>[^"]+)"\s')
+
+
+# read the script one statement at a time, skipping /* ... */ comments,
+# so that the 15,000+ INSERT statements never sit in memory together
+def iter_statements(path, encoding=SCRIPT_ENCODING):
+    buffer = []
+    in_comment = False
+    with open(path, encoding=encoding) as script:
+        for line in script:
+            stripped = line.strip()
+            if in_comment:
+                if stripped.endswith("*/"):
+                    in_comment = False
+                continue
+            if not buffer and stripped.startswith("/*"):
+                in_comment = not stripped.endswith("*/")
+                continue
+            if not buffer and not stripped:
+                continue
+            buffer.append(line)
+            # a ';' only ends the statement outside of a quoted string
+            statement = "".join(buffer)
+            if stripped.endswith(";") and statement.count("'") % 2 == 0:
+                yield statement.strip()
+                buffer = []
+    if buffer:
+        yield "".join(buffer).strip()
+
+
+# split the VALUES (...) part of an INSERT into python values,
+# N'...' and '...' become str, bare NULL becomes None, numbers stay text
+def parse_values(text):
+    values = []
+    position = 0
+    length = len(text)
+    while position < length:
+        char = text[position]
+        if char in " ,":
+            position += 1
+        elif char == "'" or text.startswith("N'", position):
+            position = text.index("'", position) + 1
+            chunks = []
+            while True:
+                end = text.index("'", position)
+                chunks.append(text[position:end])
+                if text.startswith("''", end):
+                    chunks.append("'")
+                    position = end + 2
+                else:
+                    position = end + 1
+                    break
+            values.append("".join(chunks))
+        else:
+            end = text.find(",", position)
+            if end == -1:
+                end = length
+            token = text[position:end].strip()
+            values.append(None if token.upper() == "NULL" else token)
+            position = end
+    return values
+
+
+def parse_columns(text):
+    return [column.strip().strip('"') for column in text.split(",")]
+
+
+def parse_create_table(statement):
+    match = CREATE_TABLE_PATTERN.match(statement)
+    if match is None:
+        return None, []
+    columns = []
+    for line in match.group("body").splitlines():
+        column = COLUMN_PATTERN.match(line)
+        if column is not None:
+            columns.append(column.group("column"))
+    return match.group("table"), columns
+
+
+def parse_insert(statement):
+    match = INSERT_PATTERN.match(statement)
+    if match is None:
+        return None
+    return (
+        match.group("table"),
+        parse_columns(match.group("columns")),
+        parse_values(match.group("values"))
+    )
+
+
+# COPY text format: tab separated, \N for NULL, backslash escapes
+def copy_field(value):
+    if value is None:
+        return "\\N"
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_line(values):
+    return "\t".join(copy_field(value) for value in values) + "\n"
+
+
+class TableBatch:
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns
+        self.buffer = io.StringIO()
+        self.pending = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+    def add(self, columns, values):
+        row = dict(zip(columns, values))
+        self.buffer.write(copy_line([row.get(name) for name in self.columns]))
+        self.pending += 1
+
+    def flush(self, cursor):
+        if not self.pending:
+            return
+        column_list = ", ".join('"%s"' % name for name in self.columns)
+        started = time.perf_counter()
+        self.buffer.seek(0)
+        cursor.copy_expert(
+            'COPY "%s" (%s) FROM STDIN' % (self.table, column_list),
+            self.buffer
+        )
+        self.seconds += time.perf_counter() - started
+        self.rows += self.pending
+        self.pending = 0
+        self.buffer = io.StringIO()
+
+
+def report(batch):
+    rate = batch.rows / batch.seconds if batch.seconds else 0.0
+    print(
+        batch.table,
+        "%d rows" % batch.rows,
+        "%.3fs" % batch.seconds,
+        "%.0f rows/s" % rate,
+        sep=" | "
+    )
+
+
+def drop_tables(cursor):
+    for table in CHINOOK_TABLES:
+        cursor.execute('DROP TABLE IF EXISTS "%s" CASCADE' % table)
+
+
+# run the script against an open connection: DDL statements are executed
+# as they come, INSERT rows are grouped per table and sent with COPY
+def load_script(connection, path, batch_size=BATCH_SIZE,
+                encoding=SCRIPT_ENCODING):
+    cursor = connection.cursor()
+    table_columns = {}
+    batches = {}
+    current = None
+    started = time.perf_counter()
+
+    for statement in iter_statements(path, encoding):
+        insert = parse_insert(statement) if statement[:6] == "INSERT" else None
+        if insert is None:
+            # keep the original order: finish the running COPY first
+            if current is not None:
+                current.flush(cursor)
+                report(current)
+                current = None
+            table, columns = parse_create_table(statement)
+            if table is not None:
+                table_columns[table] = columns
+            cursor.execute(statement)
+            continue
+
+        table, columns, values = insert
+        if current is None or current.table != table:
+            if current is not None:
+                current.flush(cursor)
+                report(current)
+            current = batches.get(table)
+            if current is None:
+                current = TableBatch(
+                    table, table_columns.get(table, columns)
+                )
+                batches[table] = current
+        current.add(columns, values)
+        if current.pending >= batch_size:
+            current.flush(cursor)
+
+    if current is not None:
+        current.flush(cursor)
+        report(current)
+
+    elapsed = time.perf_counter() - started
+    total = sum(batch.rows for batch in batches.values())
+    print(
+        "total",
+        "%d rows" % total,
+        "%.3fs" % elapsed,
+        "%.0f rows/s" % (total / elapsed if elapsed else 0.0),
+        sep=" | "
+    )
+    return batches
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load Chinook_PostgreSql.sql using COPY FROM STDIN"
+    )
+    parser.add_argument("script", nargs="?", default="Chinook_PostgreSql.sql")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--encoding", default=SCRIPT_ENCODING)
+    parser.add_argument(
+        "--drop", action="store_true",
+        help="drop the existing Chinook tables before loading"
+    )
+    args = parser.parse_args()
+
+    # borrow a connection to the "chinook" database, committed on success
+    with raw_connection() as connection:
+        if args.drop:
+            drop_tables(connection.cursor())
+        load_script(
+            connection, args.script, args.batch_size, args.encoding
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+from contextlib import contextmanager
+
+from sqlalchemy import (
+    Column, DateTime, Float, ForeignKey, Integer, String, Table, event
+)
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import joinedload, relationship, selectinload
+
+
+# class-based models for all eleven Chinook tables (Artist, Album and Track
+# as in sql-orm.py), kept in an importable module so that other tools can
+# share them (sql-orm.py runs its queries on import)
+base = declarative_base()
+
+# relationships load lazily by default (one query per parent on first
+# access); discography() and the LOADERS below pick joined or select-in
+# eager loading per query instead, to avoid the N+1 pattern
+
+
+# create a class-based model for the "Artist" table
+class Artist(base):
+    __tablename__ = "Artist"
+    ArtistId = Column(Integer, primary_key=True)
+    Name = Column(String)
+    albums = relationship("Album", back_populates="artist")
+
+
+# create a class-based model for the "Album" table
+class Album(base):
+    __tablename__ = "Album"
+    AlbumId = Column(Integer, primary_key=True)
+    Title = Column(String)
+    ArtistId = Column(Integer, ForeignKey("Artist.ArtistId"))
+    artist = relationship("Artist", back_populates="albums")
+    tracks = relationship("Track", back_populates="album")
+
+
+# create a class-based model for the "Genre" table
+class Genre(base):
+    __tablename__ = "Genre"
+    GenreId = Column(Integer, primary_key=True)
+    Name = Column(String)
+    tracks = relationship("Track", back_populates="genre")
+
+
+# create a class-based model for the "MediaType" table
+class MediaType(base):
+    __tablename__ = "MediaType"
+    MediaTypeId = Column(Integer, primary_key=True)
+    Name = Column(String)
+    tracks = relationship("Track", back_populates="media_type")
+
+
+# the "PlaylistTrack" link table between "Playlist" and "Track"
+playlist_track_table = Table(
+    "PlaylistTrack", base.metadata,
+    Column(
+        "PlaylistId", Integer, ForeignKey("Playlist.PlaylistId"),
+        primary_key=True
+    ),
+    Column("TrackId", Integer, ForeignKey("Track.TrackId"), primary_key=True)
+)
+
+
+# create a class-based model for the "Track" table
+class Track(base):
+    __tablename__ = "Track"
+    TrackId = Column(Integer, primary_key=True)
+    Name = Column(String)
+    AlbumId = Column(Integer, ForeignKey("Album.AlbumId"))
+    MediaTypeId = Column(Integer, ForeignKey("MediaType.MediaTypeId"))
+    GenreId = Column(Integer, ForeignKey("Genre.GenreId"))
+    Composer = Column(String)
+    Milliseconds = Column(Integer, primary_key=False)
+    Bytes = Column(Integer, primary_key=False)
+    UnitPrice = Column(Float)
+    album = relationship("Album", back_populates="tracks")
+    genre = relationship("Genre", back_populates="tracks")
+    media_type = relationship("MediaType", back_populates="tracks")
+    playlists = relationship(
+        "Playlist", secondary=playlist_track_table, back_populates="tracks"
+    )
+    invoice_lines = relationship("InvoiceLine", back_populates="track")
+
+
+# create a class-based model for the "Playlist" table
+class Playlist(base):
+    __tablename__ = "Playlist"
+    PlaylistId = Column(Integer, primary_key=True)
+    Name = Column(String)
+    tracks = relationship(
+        "Track", secondary=playlist_track_table, back_populates="playlists"
+    )
+
+
+# create a class-based model for the "Employee" table
+class Employee(base):
+    __tablename__ = "Employee"
+    EmployeeId = Column(Integer, primary_key=True)
+    LastName = Column(String)
+    FirstName = Column(String)
+    Title = Column(String)
+    ReportsTo = Column(Integer, ForeignKey("Employee.EmployeeId"))
+    BirthDate = Column(DateTime)
+    HireDate = Column(DateTime)
+    Address = Column(String)
+    City = Column(String)
+    State = Column(String)
+    Country = Column(String)
+    PostalCode = Column(String)
+    Phone = Column(String)
+    Fax = Column(String)
+    Email = Column(String)
+    manager = relationship(
+        "Employee", remote_side=[EmployeeId], back_populates="reports"
+    )
+    reports = relationship("Employee", back_populates="manager")
+    customers = relationship("Customer", back_populates="support_rep")
+
+
+# create a class-based model for the "Customer" table
+class Customer(base):
+    __tablename__ = "Customer"
+    CustomerId = Column(Integer, primary_key=True)
+    FirstName = Column(String)
+    LastName = Column(String)
+    Company = Column(String)
+    Address = Column(String)
+    City = Column(String)
+    State = Column(String)
+    Country = Column(String)
+    PostalCode = Column(String)
+    Phone = Column(String)
+    Fax = Column(String)
+    Email = Column(String)
+    SupportRepId = Column(Integer, ForeignKey("Employee.EmployeeId"))
+    support_rep = relationship("Employee", back_populates="customers")
+    invoices = relationship("Invoice", back_populates="customer")
+
+
+# create a class-based model for the "Invoice" table
+class Invoice(base):
+    __tablename__ = "Invoice"
+    InvoiceId = Column(Integer, primary_key=True)
+    CustomerId = Column(Integer, ForeignKey("Customer.CustomerId"))
+    InvoiceDate = Column(DateTime)
+    BillingAddress = Column(String)
+    BillingCity = Column(String)
+    BillingState = Column(String)
+    BillingCountry = Column(String)
+    BillingPostalCode = Column(String)
+    Total = Column(Float)
+    customer = relationship("Customer", back_populates="invoices")
+    lines = relationship("InvoiceLine", back_populates="invoice")
+
+
+# create a class-based model for the "InvoiceLine" table
+class InvoiceLine(base):
+    __tablename__ = "InvoiceLine"
+    InvoiceLineId = Column(Integer, primary_key=True)
+    InvoiceId = Column(Integer, ForeignKey("Invoice.InvoiceId"))
+    TrackId = Column(Integer, ForeignKey("Track.TrackId"))
+    UnitPrice = Column(Float)
+    Quantity = Column(Integer)
+    invoice = relationship("Invoice", back_populates="lines")
+    track = relationship("Track", back_populates="invoice_lines")
+
+
+# the Core tables behind the models, for the Expression Language
+artist_table = Artist.__table__
+album_table = Album.__table__
+track_table = Track.__table__
+
+
+# number of rows brought over per round trip by iter_chunks()
+CHUNK_SIZE = 1000
+
+
+# read-only iteration for large scans: only the named columns are selected
+# (all of them when none are given), so the rows come back as plain tuples
+# instead of identity-mapped objects, and yield_per() streams them from the
+# server in chunks of chunk_size rows
+def iter_chunks(session, model, columns=None, chunk_size=CHUNK_SIZE,
+                **filters):
+    if columns is None:
+        columns = model.__table__.columns.keys()
+    query = session.query(*[getattr(model, name) for name in columns])
+    for name, value in filters.items():
+        query = query.filter(getattr(model, name) == value)
+    query = query.execution_options(stream_results=True)
+
+    chunk = []
+    for row in query.yield_per(chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# the same as iter_chunks(), one row at a time
+def iter_rows(session, model, columns=None, chunk_size=CHUNK_SIZE,
+              **filters):
+    for chunk in iter_chunks(session, model, columns, chunk_size, **filters):
+        for row in chunk:
+            yield row
+
+
+# eager loading strategies: "joined" fetches parents and children in one
+# LEFT OUTER JOIN, "selectin" issues one extra SELECT ... WHERE IN per
+# relationship, however many parents there are
+LOADERS = {
+    "joined": joinedload,
+    "selectin": selectinload,
+}
+
+# statements discography() may issue: the artist, then albums, tracks,
+# genres and media types with "selectin" (a single one with "joined")
+DISCOGRAPHY_STATEMENTS = 5
+
+
+# an artist with all albums and tracks, and each track's genre and media
+# type, loaded in a fixed number of statements whatever the catalog size
+def discography(session, artist_id, strategy="selectin"):
+    loader = LOADERS[strategy]
+    return (
+        session.query(Artist)
+        .options(
+            loader(Artist.albums).options(
+                loader(Album.tracks).options(
+                    loader(Track.genre),
+                    loader(Track.media_type)
+                )
+            )
+        )
+        .filter(Artist.ArtistId == artist_id)
+        .first()
+    )
+
+
+# counts the statements an engine runs inside the with-block, e.g.
+# with count_statements(db) as statements: ...; then len(statements)
+@contextmanager
+def count_statements(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters,
+                              context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+# check the statement bound against the database, e.g.
+# python3 chinook_models.py 51
+if __name__ == "__main__":
+    import sys
+
+    from sqlalchemy.orm import sessionmaker
+
+    from chinook_db import db
+
+    artist_id = int(sys.argv[1]) if len(sys.argv) > 1 else 51
+    for strategy in LOADERS:
+        session = sessionmaker(db)()
+        with count_statements(db) as statements:
+            artist = discography(session, artist_id, strategy)
+            tracks = [
+                (track.Name, track.genre, track.media_type)
+                for album in artist.albums
+                for track in album.tracks
+            ]
+        assert len(statements) <= DISCOGRAPHY_STATEMENTS, statements
+        print(
+            strategy,
+            artist.Name,
+            "%d albums" % len(artist.albums),
+            "%d tracks" % len(tracks),
+            "%d statements" % len(statements),
+            sep=" | "
+        )
+        session.close()
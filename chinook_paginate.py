@@ -0,0 +1,174 @@
+import argparse
+import base64
+import json
+from collections import namedtuple
+
+from sqlalchemy import tuple_
+
+from chinook_db import db
+from chinook_models import base
+
+
+# keyset ("seek") pagination: each page starts right after the sort key of
+# the last row of the previous page, WHERE (key) > (last key), so with an
+# index on the sort columns page 10,000 costs the same as page 1, unlike
+# OFFSET which reads and throws away every earlier row
+#
+# order_by must end with the primary key so the key is unique, e.g.
+# ("Name", "ArtistId"); rows with NULL in a sort column are skipped by the
+# row comparison, so sort on NOT NULL columns
+
+PAGE_SIZE = 50
+
+# rows of one page, and the cursor of the next page (None on the last page)
+Page = namedtuple("Page", ["rows", "next_cursor"])
+
+
+# cursors are opaque to callers: the sort columns and the last key, as
+# url-safe base64 JSON
+def encode_cursor(order_by, values):
+    payload = json.dumps([list(order_by), list(values)], default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, order_by):
+    columns, values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if columns != list(order_by):
+        raise ValueError("cursor was made for a different sort order")
+    return values
+
+
+def _page(rows, order_by, page_size, key):
+    if len(rows) <= page_size:
+        return Page(rows, None)
+    rows = rows[:page_size]
+    return Page(rows, encode_cursor(order_by, key(rows[-1])))
+
+
+def _primary_key(table):
+    return tuple(table.primary_key.columns.keys())
+
+
+# psycopg2 path: table is a table name like "Track"; the sort columns
+# left out of columns are selected after them, as the next cursor needs
+def paginate_psycopg2(connection, table, order_by=None, after=None,
+                      page_size=PAGE_SIZE, descending=False, columns=None):
+    order_by = tuple(
+        order_by or _primary_key(base.metadata.tables[table])
+    )
+    quoted = ", ".join('"%s"' % name for name in order_by)
+    if columns:
+        columns = list(columns) + [
+            name for name in order_by if name not in columns
+        ]
+    select_list = (
+        ", ".join('"%s"' % name for name in columns) if columns else "*"
+    )
+    sql = 'SELECT %s FROM "%s"' % (select_list, table)
+    params = []
+    if after is not None:
+        values = decode_cursor(after, order_by)
+        sql += " WHERE (%s) %s (%s)" % (
+            quoted, "<" if descending else ">",
+            ", ".join(["%s"] * len(values))
+        )
+        params.extend(values)
+    direction = " DESC" if descending else ""
+    sql += " ORDER BY %s LIMIT %%s" % ", ".join(
+        '"%s"%s' % (name, direction) for name in order_by
+    )
+    params.append(page_size + 1)
+
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    names = [description[0] for description in cursor.description]
+    positions = [names.index(name) for name in order_by]
+    rows = cursor.fetchall()
+    cursor.close()
+    return _page(
+        rows, order_by, page_size,
+        lambda row: [row[position] for position in positions]
+    )
+
+
+# WHERE condition starting the page after the cursor, or None
+def _seek(columns, after, order_by, descending):
+    if after is None:
+        return None
+    values = decode_cursor(after, order_by)
+    key = tuple_(*columns)
+    return key < tuple_(*values) if descending else key > tuple_(*values)
+
+
+# Core path: table is a Table, e.g. chinook_models.track_table
+def paginate_core(connection, table, order_by=None, after=None,
+                  page_size=PAGE_SIZE, descending=False):
+    order_by = tuple(order_by or _primary_key(table))
+    columns = [table.c[name] for name in order_by]
+    select_query = table.select()
+    condition = _seek(columns, after, order_by, descending)
+    if condition is not None:
+        select_query = select_query.where(condition)
+    select_query = select_query.order_by(*[
+        column.desc() if descending else column for column in columns
+    ]).limit(page_size + 1)
+    rows = connection.execute(select_query).fetchall()
+    return _page(
+        rows, order_by, page_size,
+        lambda row: [getattr(row, name) for name in order_by]
+    )
+
+
+# ORM path: model is a mapped class, e.g. chinook_models.Track
+def paginate_orm(session, model, order_by=None, after=None,
+                 page_size=PAGE_SIZE, descending=False):
+    order_by = tuple(order_by or _primary_key(model.__table__))
+    columns = [getattr(model, name) for name in order_by]
+    query = session.query(model)
+    condition = _seek(columns, after, order_by, descending)
+    if condition is not None:
+        query = query.filter(condition)
+    rows = query.order_by(*[
+        column.desc() if descending else column for column in columns
+    ]).limit(page_size + 1).all()
+    return _page(
+        rows, order_by, page_size,
+        lambda row: [getattr(row, name) for name in order_by]
+    )
+
+
+# walk every page of any of the paginate_* functions, e.g.
+# for page in iter_pages(paginate_orm, session, Track): ...
+def iter_pages(paginate, handle, source, **kwargs):
+    after = kwargs.pop("after", None)
+    while True:
+        page = paginate(handle, source, after=after, **kwargs)
+        yield page
+        if page.next_cursor is None:
+            break
+        after = page.next_cursor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Print one page of a Chinook table using keyset paging"
+    )
+    parser.add_argument("table", help='e.g. "Artist" or "Track"')
+    parser.add_argument(
+        "--order-by", nargs="+",
+        help="sort columns ending with the primary key (default: the key)"
+    )
+    parser.add_argument("--after", help="cursor printed by the last page")
+    parser.add_argument("--size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--descending", action="store_true")
+    args = parser.parse_args()
+
+    table = base.metadata.tables[args.table]
+    with db.connect() as connection:
+        page = paginate_core(
+            connection, table, args.order_by, args.after, args.size,
+            args.descending
+        )
+    for row in page.rows:
+        print(*row, sep=" | ")
+    print("next:", page.next_cursor or "(last page)")
@@ -0,0 +1,287 @@
+import argparse
+import re
+from datetime import date
+
+from chinook_db import raw_connection
+
+
+# range partitioning of "Invoice" and "InvoiceLine" by "InvoiceDate", one
+# partition per month; date-bounded queries then only scan the partitions
+# they need, and old months can be detached (and dropped) instantly
+#
+# PostgreSQL requires the partition key in every unique constraint, so the
+# primary keys become ("InvoiceId", "InvoiceDate") and
+# ("InvoiceLineId", "InvoiceDate"), and "InvoiceLine" gets a copy of its
+# invoice's "InvoiceDate" to follow it into the same month; code inserting
+# invoice lines has to fill that column in
+
+PARTITION_NAME = re.compile(
+    r"^(?P<table>\w+)_p(?P<year>\d{4})_(?P<month>\d{2})$"
+)
+
+# months created ahead of the newest invoice (or of today, if later)
+MONTHS_AHEAD = 3
+
+INVOICE_COLUMNS = '''
+    "InvoiceId" INT NOT NULL,
+    "CustomerId" INT NOT NULL,
+    "InvoiceDate" TIMESTAMP NOT NULL,
+    "BillingAddress" VARCHAR(70),
+    "BillingCity" VARCHAR(40),
+    "BillingState" VARCHAR(40),
+    "BillingCountry" VARCHAR(40),
+    "BillingPostalCode" VARCHAR(10),
+    "Total" NUMERIC(10,2) NOT NULL,
+    CONSTRAINT "PK_Invoice" PRIMARY KEY  ("InvoiceId", "InvoiceDate")
+'''
+
+INVOICE_LINE_COLUMNS = '''
+    "InvoiceLineId" INT NOT NULL,
+    "InvoiceId" INT NOT NULL,
+    "TrackId" INT NOT NULL,
+    "UnitPrice" NUMERIC(10,2) NOT NULL,
+    "Quantity" INT NOT NULL,
+    "InvoiceDate" TIMESTAMP NOT NULL,
+    CONSTRAINT "PK_InvoiceLine" PRIMARY KEY  ("InvoiceLineId", "InvoiceDate")
+'''
+
+# partitioned tables are always handled in this order when dropping or
+# detaching, so no invoice line is left pointing at a missing invoice
+TABLES = ["InvoiceLine", "Invoice"]
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def partition_name(table, month):
+    return "%s_p%04d_%02d" % (table, month.year, month.month)
+
+
+def is_partitioned(cursor, table):
+    cursor.execute(
+        "SELECT relkind FROM pg_class "
+        "WHERE relname = %s AND relnamespace = 'public'::regnamespace",
+        [table]
+    )
+    row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def partition_months(cursor, table):
+    cursor.execute(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "WHERE parent.relname = %s",
+        [table]
+    )
+    months = []
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match is not None and match.group("table") == table:
+            months.append(
+                date(int(match.group("year")), int(match.group("month")), 1)
+            )
+    return sorted(months)
+
+
+def create_partition(cursor, table, month):
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS "%s" PARTITION OF "%s" '
+        "FOR VALUES FROM ('%s') TO ('%s')" % (
+            partition_name(table, month), table,
+            month.isoformat(), add_months(month, 1).isoformat()
+        )
+    )
+
+
+# create the monthly partitions of both tables from first to last month
+def create_partitions(cursor, first, last):
+    month = month_start(first)
+    last = month_start(last)
+    created = []
+    while month <= last:
+        for table in TABLES:
+            create_partition(cursor, table, month)
+        created.append(month)
+        month = add_months(month, 1)
+    return created
+
+
+# make sure partitions exist up to months_ahead months past the newest
+# invoice or today, whichever is later; safe to run from a daily job
+def ensure_partitions(connection, months_ahead=MONTHS_AHEAD, today=None):
+    cursor = connection.cursor()
+    months = partition_months(cursor, "Invoice")
+    if not months:
+        raise RuntimeError('"Invoice" is not partitioned, run convert first')
+    cursor.execute('SELECT MAX("InvoiceDate") FROM "Invoice"')
+    newest = cursor.fetchone()[0]
+    latest = month_start(today or date.today())
+    if newest is not None:
+        latest = max(latest, month_start(newest))
+    created = create_partitions(
+        cursor, add_months(months[-1], 1), add_months(latest, months_ahead)
+    )
+    connection.commit()
+    return created
+
+
+# rebuild both tables as partitioned tables in one transaction; the old
+# tables are kept as "Invoice_unpartitioned" and
+# "InvoiceLine_unpartitioned" unless drop_old is set
+def convert(connection, months_ahead=MONTHS_AHEAD, drop_old=False):
+    cursor = connection.cursor()
+    if is_partitioned(cursor, "Invoice"):
+        raise RuntimeError('"Invoice" is already partitioned')
+
+    cursor.execute('LOCK TABLE "Invoice", "InvoiceLine" IN EXCLUSIVE MODE')
+    cursor.execute('SELECT MIN("InvoiceDate"), MAX("InvoiceDate") '
+                   'FROM "Invoice"')
+    first, last = cursor.fetchone()
+    today = date.today()
+    first = month_start(first or today)
+    last = add_months(month_start(max(last.date(), today)
+                                  if last else today), months_ahead)
+
+    for table in TABLES:
+        cursor.execute(
+            'ALTER TABLE "%s" RENAME TO "%s_unpartitioned"' % (table, table)
+        )
+        cursor.execute(
+            'ALTER TABLE "%s_unpartitioned" RENAME CONSTRAINT "PK_%s" '
+            'TO "PK_%s_unpartitioned"' % (table, table, table)
+        )
+    cursor.execute('ALTER TABLE "InvoiceLine_unpartitioned" '
+                   'DROP CONSTRAINT "FK_InvoiceLineInvoiceId"')
+
+    cursor.execute(
+        'CREATE TABLE "Invoice" (%s) PARTITION BY RANGE ("InvoiceDate")'
+        % INVOICE_COLUMNS
+    )
+    cursor.execute(
+        'CREATE TABLE "InvoiceLine" (%s) PARTITION BY RANGE ("InvoiceDate")'
+        % INVOICE_LINE_COLUMNS
+    )
+    create_partitions(cursor, first, last)
+
+    cursor.execute(
+        'INSERT INTO "Invoice" SELECT * FROM "Invoice_unpartitioned"'
+    )
+    cursor.execute(
+        'INSERT INTO "InvoiceLine" '
+        'SELECT il.*, i."InvoiceDate" '
+        'FROM "InvoiceLine_unpartitioned" il '
+        'JOIN "Invoice_unpartitioned" i ON i."InvoiceId" = il."InvoiceId"'
+    )
+
+    if drop_old:
+        for table in TABLES:
+            cursor.execute('DROP TABLE "%s_unpartitioned"' % table)
+    else:
+        # the index names are schema wide, free them for the new tables
+        for index in ("IFK_InvoiceCustomerId", "IFK_InvoiceLineInvoiceId",
+                      "IFK_InvoiceLineTrackId"):
+            cursor.execute('ALTER INDEX "%s" RENAME TO "%s_unpartitioned"'
+                           % (index, index))
+
+    cursor.execute(
+        'ALTER TABLE "Invoice" ADD CONSTRAINT "FK_InvoiceCustomerId" '
+        'FOREIGN KEY ("CustomerId") REFERENCES "Customer" ("CustomerId") '
+        'ON DELETE NO ACTION ON UPDATE NO ACTION'
+    )
+    cursor.execute(
+        'CREATE INDEX "IFK_InvoiceCustomerId" ON "Invoice" ("CustomerId")'
+    )
+    cursor.execute(
+        'ALTER TABLE "InvoiceLine" ADD CONSTRAINT "FK_InvoiceLineInvoiceId" '
+        'FOREIGN KEY ("InvoiceId", "InvoiceDate") '
+        'REFERENCES "Invoice" ("InvoiceId", "InvoiceDate") '
+        'ON DELETE NO ACTION ON UPDATE NO ACTION'
+    )
+    cursor.execute(
+        'CREATE INDEX "IFK_InvoiceLineInvoiceId" '
+        'ON "InvoiceLine" ("InvoiceId")'
+    )
+    cursor.execute(
+        'ALTER TABLE "InvoiceLine" ADD CONSTRAINT "FK_InvoiceLineTrackId" '
+        'FOREIGN KEY ("TrackId") REFERENCES "Track" ("TrackId") '
+        'ON DELETE NO ACTION ON UPDATE NO ACTION'
+    )
+    cursor.execute(
+        'CREATE INDEX "IFK_InvoiceLineTrackId" ON "InvoiceLine" ("TrackId")'
+    )
+    for table in TABLES:
+        cursor.execute('ANALYZE "%s"' % table)
+    connection.commit()
+    return first, last
+
+
+# detach every month that ends on or before the given date, invoice lines
+# first; a detached partition is a plain table again (a line partition
+# loses its foreign key to "Invoice"), dropped if drop is set
+def detach_before(connection, before, drop=False):
+    cursor = connection.cursor()
+    detached = []
+    for table in TABLES:
+        for month in partition_months(cursor, table):
+            if add_months(month, 1) > before:
+                continue
+            name = partition_name(table, month)
+            cursor.execute(
+                'ALTER TABLE "%s" DETACH PARTITION "%s"' % (table, name)
+            )
+            if table == "InvoiceLine":
+                # a detached partition keeps its foreign key to the still
+                # partitioned "Invoice", which would then refuse to detach
+                # the same month
+                cursor.execute(
+                    'ALTER TABLE "%s" DROP CONSTRAINT IF EXISTS '
+                    '"FK_InvoiceLineInvoiceId"' % name
+                )
+            if drop:
+                cursor.execute('DROP TABLE "%s"' % name)
+            detached.append(name)
+    connection.commit()
+    return detached
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Range-partition "Invoice" and "InvoiceLine" by month'
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser(
+        "convert", help="rebuild both tables as partitioned tables"
+    )
+    command.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    command.add_argument("--drop-old", action="store_true")
+    command = commands.add_parser(
+        "ensure", help="create the partitions for the coming months"
+    )
+    command.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    command = commands.add_parser(
+        "detach", help="detach the months that end before a date"
+    )
+    command.add_argument("before", type=date.fromisoformat)
+    command.add_argument("--drop", action="store_true")
+    args = parser.parse_args()
+
+    with raw_connection() as connection:
+        if args.command == "convert":
+            first, last = convert(
+                connection, args.months_ahead, args.drop_old
+            )
+            print("partitioned from", first, "to", last)
+        elif args.command == "ensure":
+            for month in ensure_partitions(connection, args.months_ahead):
+                print("created", month.strftime("%Y-%m"))
+        else:
+            for name in detach_before(connection, args.before, args.drop):
+                print("detached", name)
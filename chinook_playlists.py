@@ -0,0 +1,284 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from chinook_db import raw_connection
+from chinook_models import Playlist
+
+
+# in-memory membership index of "PlaylistTrack": each playlist is a sorted
+# int32 array of its track ids and each track a sorted array of its
+# playlist ids, so membership is a binary search and intersections and
+# Jaccard similarity are one np.intersect1d, instead of a join per question;
+# memory follows the number of memberships, not the largest id
+#
+# refresh() compares a per-playlist checksum with the database and only
+# reloads the playlists that changed; watch() does the same for playlists
+# changed through an ORM session, right after the commit
+
+CHECKSUM_SQL = (
+    'SELECT "PlaylistId", COUNT(*), SUM("TrackId"), '
+    'SUM("TrackId"::bigint * "TrackId") '
+    'FROM "PlaylistTrack" GROUP BY "PlaylistId"'
+)
+
+EMPTY = np.empty(0, dtype=np.int32)
+EMPTY.flags.writeable = False
+
+
+# ids in all of the sorted arrays; a new array, never one of the inputs
+def intersect(members):
+    if not members:
+        return EMPTY
+    # smallest first, so the running intersection shrinks fastest
+    members = sorted(members, key=len)
+    ids = members[0].copy()
+    for other in members[1:]:
+        ids = np.intersect1d(ids, other, assume_unique=True)
+    return ids
+
+
+def jaccard(a, b):
+    shared = len(np.intersect1d(a, b, assume_unique=True))
+    union = len(a) + len(b) - shared
+    return shared / union if union else 0.0
+
+
+def contains(ids, member):
+    position = np.searchsorted(ids, member)
+    return bool(position < len(ids) and ids[position] == member)
+
+
+# split (key, value) pairs sorted by key into {key: sorted values}
+def group(keys, values):
+    keys, starts = np.unique(keys, return_index=True)
+    ends = np.append(starts[1:], len(values))
+    return dict(
+        (int(key), values[start:end])
+        for key, start, end in zip(keys, starts, ends)
+    )
+
+
+class PlaylistIndex:
+    def __init__(self):
+        self.playlists = {}
+        self.tracks = {}
+        self.checksums = {}
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.reloads = 0
+        # each index collects its own playlists, so several can watch a
+        # session
+        self.written_key = "playlist_index_written_%d" % id(self)
+
+    @classmethod
+    def load(cls, connection=None):
+        index = cls()
+        index.refresh(connection, full=True)
+        return index
+
+    def _fetch(self, cursor, playlist_ids=None):
+        sql = 'SELECT "PlaylistId", "TrackId" FROM "PlaylistTrack"'
+        params = []
+        if playlist_ids is not None:
+            sql += ' WHERE "PlaylistId" = ANY(%s)'
+            params.append(list(playlist_ids))
+        cursor.execute(sql + ' ORDER BY "PlaylistId", "TrackId"', params)
+        rows = np.array(cursor.fetchall(), dtype=np.int32).reshape(-1, 2)
+        # one array per playlist from the sorted pairs, in a single pass
+        return group(rows[:, 0], rows[:, 1].copy())
+
+    # replace every playlist, and rebuild the track side in one sort
+    def _replace_all(self, playlists):
+        self.playlists = playlists
+        if not playlists:
+            self.tracks = {}
+            return
+        tracks = np.concatenate(list(playlists.values()))
+        members = np.repeat(
+            np.fromiter(playlists, dtype=np.int32, count=len(playlists)),
+            [len(ids) for ids in playlists.values()]
+        )
+        order = np.lexsort((members, tracks))
+        self.tracks = group(tracks[order], members[order])
+
+    def _replace(self, playlist_id, ids):
+        old = self.playlists.pop(playlist_id, EMPTY)
+        member = np.array([playlist_id], dtype=np.int32)
+        for track in np.setdiff1d(old, ids, assume_unique=True).tolist():
+            remaining = np.setdiff1d(
+                self.tracks[track], member, assume_unique=True
+            )
+            if len(remaining):
+                self.tracks[track] = remaining
+            else:
+                del self.tracks[track]
+        for track in np.setdiff1d(ids, old, assume_unique=True).tolist():
+            self.tracks[track] = np.union1d(
+                self.tracks.get(track, EMPTY), member
+            )
+        if len(ids):
+            self.playlists[playlist_id] = ids
+
+    # reload the playlists whose checksum changed (all of them when full is
+    # set); returns the ids of the reloaded playlists
+    def refresh(self, connection=None, full=False):
+        if connection is None:
+            with raw_connection() as connection:
+                return self.refresh(connection, full)
+
+        cursor = connection.cursor()
+        cursor.execute(CHECKSUM_SQL)
+        checksums = dict(
+            (row[0], tuple(row[1:])) for row in cursor.fetchall()
+        )
+        with self.lock:
+            if full:
+                changed = set(checksums) | set(self.playlists)
+            else:
+                changed = set(
+                    playlist
+                    for playlist in set(checksums) | set(self.checksums)
+                    if checksums.get(playlist) != self.checksums.get(playlist)
+                )
+            if changed:
+                fetched = self._fetch(
+                    cursor, None if full else sorted(changed)
+                )
+                if full:
+                    self._replace_all(fetched)
+                else:
+                    for playlist in changed:
+                        self._replace(playlist, fetched.get(playlist, EMPTY))
+                self.reloads += len(changed)
+            self.checksums = checksums
+            self.loaded_at = time.time()
+        return sorted(changed)
+
+    # reload some playlists now, without comparing checksums first
+    def refresh_playlists(self, playlist_ids, connection=None):
+        if connection is None:
+            with raw_connection() as connection:
+                return self.refresh_playlists(playlist_ids, connection)
+        playlist_ids = sorted(set(playlist_ids))
+        cursor = connection.cursor()
+        fetched = self._fetch(cursor, playlist_ids)
+        with self.lock:
+            for playlist in playlist_ids:
+                ids = fetched.get(playlist, EMPTY)
+                self._replace(playlist, ids)
+                if len(ids):
+                    wide = ids.astype(np.int64)
+                    self.checksums[playlist] = (
+                        len(ids), int(wide.sum()), int((wide * wide).sum())
+                    )
+                else:
+                    self.checksums.pop(playlist, None)
+            self.reloads += len(playlist_ids)
+        return playlist_ids
+
+    def contains(self, playlist_id, track_id):
+        return contains(self.playlists.get(playlist_id, EMPTY), track_id)
+
+    def tracks_of(self, playlist_id):
+        return self.playlists.get(playlist_id, EMPTY).copy()
+
+    def size(self, playlist_id):
+        return len(self.playlists.get(playlist_id, EMPTY))
+
+    # playlists holding any of the tracks, or all of them when every is set
+    def playlists_with(self, track_ids, every=False):
+        members = [self.tracks.get(track, EMPTY) for track in track_ids]
+        if every:
+            return intersect(members)
+        return np.unique(np.concatenate(members)) if members else EMPTY
+
+    def shared_tracks(self, *playlist_ids):
+        return intersect([
+            self.playlists.get(playlist, EMPTY) for playlist in playlist_ids
+        ])
+
+    def similarity(self, a, b):
+        return jaccard(
+            self.playlists.get(a, EMPTY), self.playlists.get(b, EMPTY)
+        )
+
+    # the k playlists most similar to one playlist, best first
+    def most_similar(self, playlist_id, k=5):
+        ids = self.playlists.get(playlist_id, EMPTY)
+        scores = [
+            (jaccard(ids, other), playlist)
+            for playlist, other in self.playlists.items()
+            if playlist != playlist_id
+        ]
+        scores.sort(reverse=True)
+        return [(playlist, score) for score, playlist in scores[:k]]
+
+    # reload the playlists changed through an ORM session once it commits
+    def watch(self, target=Session):
+        event.listen(target, "after_flush", self._after_flush)
+        event.listen(target, "after_commit", self._after_commit)
+        event.listen(target, "after_rollback", self._after_rollback)
+        return self
+
+    def _after_flush(self, session, flush_context):
+        written = session.info.setdefault(self.written_key, set())
+        for instance in list(session.new) + list(session.dirty) + \
+                list(session.deleted):
+            if isinstance(instance, Playlist):
+                written.add(instance.PlaylistId)
+
+    def _after_commit(self, session):
+        written = session.info.pop(self.written_key, None)
+        if written:
+            self.refresh_playlists(written)
+
+    def _after_rollback(self, session):
+        session.info.pop(self.written_key, None)
+
+    def stats(self):
+        return {
+            "playlists": len(self.playlists),
+            "tracks": len(self.tracks),
+            "memberships": sum(
+                len(ids) for ids in self.playlists.values()
+            ),
+            "reloads": self.reloads,
+            "loaded_at": self.loaded_at,
+        }
+
+
+def timed(function, repeat=10000):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Playlist membership, overlap and similarity queries"
+    )
+    parser.add_argument("playlist", type=int)
+    parser.add_argument("other", type=int, nargs="?")
+    args = parser.parse_args()
+
+    index = PlaylistIndex.load()
+    print(index.stats())
+    print("tracks", index.size(args.playlist),
+          "%.2f us" % timed(lambda: index.size(args.playlist)), sep=" | ")
+    if args.other is not None:
+        shared = index.shared_tracks(args.playlist, args.other)
+        print("shared", len(shared), "%.2f us" % timed(
+            lambda: index.shared_tracks(args.playlist, args.other)
+        ), sep=" | ")
+        print("jaccard", "%.3f" % index.similarity(args.playlist, args.other),
+              "%.2f us" % timed(
+                  lambda: index.similarity(args.playlist, args.other)
+              ), sep=" | ")
+    for playlist, score in index.most_similar(args.playlist):
+        print("similar", playlist, "%.3f" % score, sep=" | ")
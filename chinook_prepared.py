@@ -0,0 +1,107 @@
+import threading
+
+from sqlalchemy import text
+
+
+# the hot point lookups (queries 3, 4 and 5), prepared on the server once
+# per pooled connection so PostgreSQL parses and plans them only once
+STATEMENTS = {
+    "artist_by_name": (
+        'SELECT * FROM "Artist" WHERE "Name" = $1', ["varchar"]
+    ),
+    "artist_by_id": (
+        'SELECT * FROM "Artist" WHERE "ArtistId" = $1', ["int"]
+    ),
+    "albums_by_artist": (
+        'SELECT * FROM "Album" WHERE "ArtistId" = $1', ["int"]
+    ),
+}
+
+
+class PreparedStatements:
+    def __init__(self, statements=STATEMENTS):
+        self.statements = dict(statements)
+        self.lock = threading.Lock()
+        # prepared names per raw psycopg2 connection, keyed by id() and
+        # checked against the backend pid in case the id gets reused
+        self.raw_prepared = {}
+        self.hits = 0
+        self.misses = 0
+        self.calls = {}
+
+    def register(self, name, sql, types):
+        self.statements[name] = (sql, list(types))
+
+    def prepare_sql(self, name):
+        sql, types = self.statements[name]
+        return "PREPARE %s (%s) AS %s" % (name, ", ".join(types), sql)
+
+    def _count(self, name, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _raw_names(self, connection):
+        backend = connection.get_backend_pid()
+        entry = self.raw_prepared.get(id(connection))
+        if entry is None or entry[0] != backend:
+            entry = (backend, set())
+            self.raw_prepared[id(connection)] = entry
+        return entry[1]
+
+    # psycopg2 path (sql-psycopg2.py): runs EXECUTE on the given cursor,
+    # fetch the rows from it as usual afterwards
+    def execute(self, cursor, name, params):
+        prepared = self._raw_names(cursor.connection)
+        hit = name in prepared
+        if not hit:
+            cursor.execute(self.prepare_sql(name))
+            prepared.add(name)
+        self._count(name, hit)
+        placeholders = ", ".join(["%s"] * len(params))
+        cursor.execute("EXECUTE %s (%s)" % (name, placeholders), params)
+        return cursor
+
+    # SQLAlchemy path: the prepared names live in the pool record's info
+    # dict, which is dropped whenever the pool replaces the connection
+    def _execute_text(self, connection, name, params):
+        prepared = connection.connection.info.setdefault(
+            "prepared_statements", set()
+        )
+        hit = name in prepared
+        if not hit:
+            connection.execute(text(self.prepare_sql(name)))
+            prepared.add(name)
+        self._count(name, hit)
+        binds = dict(("p%d" % index, value)
+                     for index, value in enumerate(params))
+        placeholders = ", ".join(":" + key for key in binds)
+        return text("EXECUTE %s (%s)" % (name, placeholders)), binds
+
+    # Core path (sql-expression.py): returns the result of the EXECUTE
+    def execute_core(self, connection, name, params):
+        statement, binds = self._execute_text(connection, name, params)
+        return connection.execute(statement, binds)
+
+    # ORM path (sql-orm.py): maps the EXECUTE result back onto model
+    def query_orm(self, session, model, name, params):
+        statement, binds = self._execute_text(
+            session.connection(), name, params
+        )
+        return session.query(model).from_statement(statement).params(binds)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "calls": dict(self.calls),
+        }
+
+
+# shared registry used by the scripts
+prepared = PreparedStatements()
@@ -0,0 +1,260 @@
+import argparse
+
+from chinook_db import raw_connection
+
+
+# sales summary tables kept next to the Chinook schema; each refresh only
+# folds in the invoices added since the last watermark, so report queries
+# read a handful of pre-aggregated rows however long the invoice history is
+#
+# the watermark is the highest "InvoiceId" already rolled up: invoices are
+# append-only here, changes to existing invoices need refresh(full=True)
+#
+# under READ COMMITTED an invoice with a lower id can commit after one with
+# a higher id, so a refresh in between would move the watermark past it for
+# good; a guard trigger on "Invoice" and "InvoiceLine" prevents that:
+# - every insert holds the watermark row FOR SHARE until it commits, and
+#   refresh() takes it FOR UPDATE, so it waits for the inserts in flight
+#   before reading MAX("InvoiceId")
+# - an insert at or below the watermark (a late id, or a line added to an
+#   invoice already rolled up) raises instead of being silently skipped
+
+ROLLUP_TABLES = {
+    "SalesByMonth": '"Month" DATE NOT NULL PRIMARY KEY',
+    "SalesByCountry": '"Country" VARCHAR(40) NOT NULL PRIMARY KEY',
+    "SalesByGenre": '"GenreId" INT NOT NULL PRIMARY KEY',
+    "SalesByArtist": '"ArtistId" INT NOT NULL PRIMARY KEY',
+}
+
+# rollup table -> (key column, key expression), missing keys roll up to 0
+ROLLUP_KEYS = {
+    "SalesByMonth": (
+        "Month", 'date_trunc(\'month\', i."InvoiceDate")::date'
+    ),
+    "SalesByCountry": ("Country", 'COALESCE(i."BillingCountry", \'\')'),
+    "SalesByGenre": ("GenreId", 'COALESCE(t."GenreId", 0)'),
+    "SalesByArtist": ("ArtistId", 'COALESCE(al."ArtistId", 0)'),
+}
+
+CREATE_WATERMARK = '''
+CREATE TABLE IF NOT EXISTS "RollupWatermark"
+(
+    "Name" VARCHAR(40) NOT NULL PRIMARY KEY,
+    "LastInvoiceId" INT NOT NULL,
+    "RefreshedAt" TIMESTAMP NOT NULL DEFAULT now()
+)
+'''
+
+CREATE_ROLLUP = '''
+CREATE TABLE IF NOT EXISTS "%s"
+(
+    %s,
+    "Revenue" NUMERIC(14,2) NOT NULL,
+    "Quantity" BIGINT NOT NULL,
+    "Invoices" BIGINT NOT NULL
+)
+'''
+
+# one pass over the new invoice lines per rollup, merged into the existing
+# totals; an invoice with tracks of several genres (or artists) counts once
+# under each of them
+FOLD_ROLLUP = '''
+INSERT INTO "%(table)s" ("%(key)s", "Revenue", "Quantity", "Invoices")
+SELECT %(expression)s,
+       SUM(il."UnitPrice" * il."Quantity"),
+       SUM(il."Quantity"),
+       COUNT(DISTINCT i."InvoiceId")
+FROM "InvoiceLine" il
+JOIN "Invoice" i ON i."InvoiceId" = il."InvoiceId"
+LEFT JOIN "Track" t ON t."TrackId" = il."TrackId"
+LEFT JOIN "Album" al ON al."AlbumId" = t."AlbumId"
+WHERE i."InvoiceId" > %%(low)s AND i."InvoiceId" <= %%(high)s
+GROUP BY 1
+ON CONFLICT ("%(key)s") DO UPDATE SET
+    "Revenue" = "%(table)s"."Revenue" + EXCLUDED."Revenue",
+    "Quantity" = "%(table)s"."Quantity" + EXCLUDED."Quantity",
+    "Invoices" = "%(table)s"."Invoices" + EXCLUDED."Invoices"
+'''
+
+WATERMARK = "sales"
+
+GUARDED_TABLES = ["Invoice", "InvoiceLine"]
+
+CREATE_GUARD_FUNCTION = '''
+CREATE OR REPLACE FUNCTION "RollupWatermarkGuard"() RETURNS trigger AS $$
+DECLARE
+    last INT;
+BEGIN
+    SELECT "LastInvoiceId" INTO last FROM "RollupWatermark"
+    WHERE "Name" = TG_ARGV[0] FOR SHARE;
+    IF NEW."InvoiceId" <= last THEN
+        RAISE EXCEPTION 'invoice % is at or below the % rollup watermark %, '
+            'use a higher id or refresh the rollups with full=True',
+            NEW."InvoiceId", TG_ARGV[0], last;
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+'''
+
+CREATE_GUARD = '''
+DROP TRIGGER IF EXISTS "TR_%(table)sRollupWatermark" ON "%(table)s";
+CREATE TRIGGER "TR_%(table)sRollupWatermark"
+    BEFORE INSERT ON "%(table)s"
+    FOR EACH ROW EXECUTE FUNCTION "RollupWatermarkGuard"('%(name)s')
+'''
+
+
+# install the guard triggers on the tables that lack them (e.g. "Invoice"
+# rebuilt by chinook_partition.convert()), so refreshes that find them in
+# place take no lock on the invoice tables
+def create_guards(cursor):
+    cursor.execute(
+        "SELECT relname FROM pg_trigger "
+        "JOIN pg_class ON pg_class.oid = tgrelid "
+        "WHERE tgname = 'TR_' || relname || 'RollupWatermark' "
+        "AND relname = ANY(%s) AND relnamespace = 'public'::regnamespace",
+        [GUARDED_TABLES]
+    )
+    guarded = set(row[0] for row in cursor.fetchall())
+    missing = [table for table in GUARDED_TABLES if table not in guarded]
+    if missing:
+        cursor.execute(CREATE_GUARD_FUNCTION)
+    for table in missing:
+        cursor.execute(CREATE_GUARD % {"table": table, "name": WATERMARK})
+    return missing
+
+
+def create_rollups(cursor):
+    cursor.execute(CREATE_WATERMARK)
+    for table, key in ROLLUP_TABLES.items():
+        cursor.execute(CREATE_ROLLUP % (table, key))
+    cursor.execute(
+        'INSERT INTO "RollupWatermark" ("Name", "LastInvoiceId") '
+        "VALUES (%s, 0) ON CONFLICT DO NOTHING",
+        [WATERMARK]
+    )
+    create_guards(cursor)
+
+
+# fold the invoices added since the last refresh into every rollup, in one
+# transaction; returns the (low, high] invoice id range that was added
+def refresh(connection, full=False):
+    cursor = connection.cursor()
+    create_rollups(cursor)
+    if full:
+        for table in ROLLUP_TABLES:
+            cursor.execute('TRUNCATE "%s"' % table)
+        cursor.execute(
+            'UPDATE "RollupWatermark" SET "LastInvoiceId" = 0 '
+            'WHERE "Name" = %s',
+            [WATERMARK]
+        )
+
+    # the row lock keeps two refreshes from folding the same invoices, and
+    # waits for the inserts holding it FOR SHARE (see the guard trigger);
+    # the MAX() below then runs with a new snapshot that sees them
+    cursor.execute(
+        'SELECT "LastInvoiceId" FROM "RollupWatermark" '
+        'WHERE "Name" = %s FOR UPDATE',
+        [WATERMARK]
+    )
+    low = cursor.fetchone()[0]
+    cursor.execute('SELECT COALESCE(MAX("InvoiceId"), 0) FROM "Invoice"')
+    high = cursor.fetchone()[0]
+
+    if high > low:
+        for table, (key, expression) in ROLLUP_KEYS.items():
+            cursor.execute(
+                FOLD_ROLLUP % {
+                    "table": table, "key": key, "expression": expression
+                },
+                {"low": low, "high": high}
+            )
+        cursor.execute(
+            'UPDATE "RollupWatermark" '
+            'SET "LastInvoiceId" = %s, "RefreshedAt" = now() '
+            'WHERE "Name" = %s',
+            [high, WATERMARK]
+        )
+    connection.commit()
+    return low, high
+
+
+def _fetch(connection, sql, params=None):
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+# revenue per month, optionally between two dates (inclusive)
+def sales_by_month(connection, start=None, end=None):
+    return _fetch(
+        connection,
+        'SELECT "Month", "Revenue", "Quantity", "Invoices" '
+        'FROM "SalesByMonth" '
+        'WHERE (%(start)s::date IS NULL OR "Month" >= %(start)s) '
+        'AND (%(end)s::date IS NULL OR "Month" <= %(end)s) '
+        'ORDER BY "Month"',
+        {"start": start, "end": end}
+    )
+
+
+def sales_by_country(connection, limit=None):
+    return _fetch(
+        connection,
+        'SELECT "Country", "Revenue", "Quantity", "Invoices" '
+        'FROM "SalesByCountry" ORDER BY "Revenue" DESC LIMIT %s',
+        [limit]
+    )
+
+
+def sales_by_genre(connection, limit=None):
+    return _fetch(
+        connection,
+        'SELECT s."GenreId", g."Name", s."Revenue", s."Quantity" '
+        'FROM "SalesByGenre" s '
+        'LEFT JOIN "Genre" g ON g."GenreId" = s."GenreId" '
+        'ORDER BY s."Revenue" DESC LIMIT %s',
+        [limit]
+    )
+
+
+def sales_by_artist(connection, limit=None):
+    return _fetch(
+        connection,
+        'SELECT s."ArtistId", a."Name", s."Revenue", s."Quantity" '
+        'FROM "SalesByArtist" s '
+        'LEFT JOIN "Artist" a ON a."ArtistId" = s."ArtistId" '
+        'ORDER BY s."Revenue" DESC LIMIT %s',
+        [limit]
+    )
+
+
+REPORTS = {
+    "month": lambda connection, limit: sales_by_month(connection),
+    "country": sales_by_country,
+    "genre": sales_by_genre,
+    "artist": sales_by_artist,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Refresh and query the Chinook sales rollups"
+    )
+    parser.add_argument(
+        "--full", action="store_true",
+        help="rebuild the rollups from scratch instead of incrementally"
+    )
+    parser.add_argument("--report", choices=sorted(REPORTS))
+    parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    with raw_connection() as connection:
+        low, high = refresh(connection, args.full)
+        print("rolled up invoices %d to %d" % (low + 1, high)
+              if high > low else "rollups already up to date")
+        if args.report:
+            for row in REPORTS[args.report](connection, args.limit):
+                print(*row, sep=" | ")
@@ -0,0 +1,167 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+
+
+# remembers which tables are known to exist, per database, in a small JSON
+# file, so a short-lived script checks the catalog once instead of running
+# create_all() (one round trip per table) on every start
+#
+# the file is only a hint: when a statement later fails because a table is
+# missing, forget() it and check again
+#
+# it also keeps reflected MetaData on disk (load_metadata()), keyed by a
+# fingerprint of the schema, so every table is available to Core queries
+# after a single catalog query instead of a full reflection per process
+#
+# only the standard library is imported here, so the fast paths of
+# chinook_cli.py can use it without paying for SQLAlchemy
+
+# the same setting as chinook_db.DATABASE
+DATABASE = os.environ.get("CHINOOK_DATABASE", "chinook")
+CACHE_DIRECTORY = os.environ.get(
+    "CHINOOK_SCHEMA_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "chinook")
+)
+
+
+def cache_path(database=DATABASE):
+    return os.path.join(CACHE_DIRECTORY, "tables-%s.json" % database)
+
+
+def known_tables(database=DATABASE):
+    try:
+        with open(cache_path(database)) as cache:
+            return set(json.load(cache))
+    except (OSError, ValueError):
+        return set()
+
+
+def remember(tables, database=DATABASE):
+    tables = known_tables(database) | set(tables)
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    path = cache_path(database)
+    with open(path + ".tmp", "w") as cache:
+        json.dump(sorted(tables), cache)
+    os.replace(path + ".tmp", path)
+
+
+def forget(database=DATABASE):
+    try:
+        os.remove(cache_path(database))
+    except FileNotFoundError:
+        pass
+
+
+# raw path: the tables not cached are looked up in one catalog query;
+# returns the names that do not exist
+def missing_tables(cursor, tables, database=DATABASE):
+    unknown = sorted(set(tables) - known_tables(database))
+    if not unknown:
+        return []
+    cursor.execute(
+        "SELECT name FROM unnest(%s::text[]) AS name "
+        "WHERE to_regclass(quote_ident(name)) IS NULL",
+        [unknown]
+    )
+    missing = [row[0] for row in cursor.fetchall()]
+    found = set(unknown) - set(missing)
+    if found:
+        remember(found, database)
+    return missing
+
+
+# SQLAlchemy path: create_all() restricted to the tables not cached yet
+def ensure_schema(engine, metadata, database=DATABASE):
+    known = known_tables(database)
+    tables = [
+        table for name, table in metadata.tables.items() if name not in known
+    ]
+    if tables:
+        metadata.create_all(engine, tables=tables, checkfirst=True)
+        remember([table.name for table in tables], database)
+    return [table.name for table in tables]
+
+
+# one line per column, constraint and index of the tables (all of the
+# public schema when tables is NULL), hashed; any DDL that reflection would
+# see changes the hash
+FINGERPRINT_SQL = """
+SELECT md5(COALESCE(string_agg(line, E'\\n' ORDER BY line), ''))
+FROM (
+    SELECT 'column ' || c.relname || '.' || a.attname || ' '
+           || format_type(a.atttypid, a.atttypmod) || ' '
+           || a.attnotnull::text || ' ' || a.attnum::text
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    WHERE c.relnamespace = 'public'::regnamespace
+      AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+      AND a.attnum > 0 AND NOT a.attisdropped
+      AND (%(tables)s::text[] IS NULL OR c.relname = ANY(%(tables)s))
+    UNION ALL
+    SELECT 'constraint ' || c.relname || '.' || k.conname || ' '
+           || pg_get_constraintdef(k.oid)
+    FROM pg_constraint k
+    JOIN pg_class c ON c.oid = k.conrelid
+    WHERE c.relnamespace = 'public'::regnamespace
+      AND (%(tables)s::text[] IS NULL OR c.relname = ANY(%(tables)s))
+    UNION ALL
+    SELECT 'index ' || pg_get_indexdef(i.indexrelid)
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indrelid
+    WHERE c.relnamespace = 'public'::regnamespace
+      AND (%(tables)s::text[] IS NULL OR c.relname = ANY(%(tables)s))
+) lines (line)
+"""
+
+
+def schema_fingerprint(connection, tables=None):
+    tables = sorted(tables) if tables else None
+    return connection.exec_driver_sql(
+        FINGERPRINT_SQL, {"tables": tables}
+    ).scalar()
+
+
+def metadata_path(fingerprint, tables=None, database=DATABASE):
+    # the table list is part of the key, so subsets get their own files
+    scope = hashlib.md5(
+        ",".join(sorted(tables or [])).encode()
+    ).hexdigest()[:8]
+    return os.path.join(
+        CACHE_DIRECTORY,
+        "metadata-%s-%s-%s.pickle" % (database, scope, fingerprint)
+    )
+
+
+# MetaData with every table (or only the given ones), reflected the first
+# time and unpickled from the cache while the schema fingerprint stays the
+# same; a changed schema gets a new fingerprint, so it is reflected again
+# and the files of the old fingerprint are removed
+def load_metadata(engine, tables=None, database=DATABASE):
+    from sqlalchemy import MetaData
+
+    with engine.connect() as connection:
+        fingerprint = schema_fingerprint(connection, tables)
+        path = metadata_path(fingerprint, tables, database)
+        try:
+            with open(path, "rb") as cache:
+                return pickle.load(cache)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            pass
+
+        metadata = MetaData()
+        metadata.reflect(
+            bind=connection, only=sorted(tables) if tables else None
+        )
+
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    stale = path.rsplit("-", 1)[0] + "-*.pickle"
+    for old in glob.glob(stale):
+        os.remove(old)
+    with open(path + ".tmp", "wb") as cache:
+        pickle.dump(metadata, cache)
+    os.replace(path + ".tmp", path)
+    remember(metadata.tables, database)
+    return metadata
@@ -0,0 +1,197 @@
+import argparse
+import time
+from collections import namedtuple
+
+from chinook_db import raw_connection
+
+
+# fuzzy and full-text search over track, album and artist names, backed by
+# pg_trgm trigram indexes (partial and misspelled matches) and tsvector
+# indexes (whole words), instead of ILIKE '%...%' full table scans
+
+# one search hit: kind is "track", "album" or "artist"
+Result = namedtuple("Result", ["kind", "id", "label", "rank"])
+
+LIMIT = 20
+
+# the text search configuration; "simple" does no stemming, which suits
+# names and titles in many languages
+TS_CONFIG = "simple"
+
+# per searchable table: the id and label columns, the columns matched by
+# trigram, and the document expression of its tsvector index (the queries
+# must repeat the indexed expression exactly for the index to be used)
+TARGETS = {
+    "track": {
+        "table": "Track",
+        "id": "TrackId",
+        "label": "Name",
+        "fuzzy": ["Name", "Composer"],
+        "document": (
+            'COALESCE("Name", \'\') || \' \' || COALESCE("Composer", \'\')'
+        ),
+    },
+    "album": {
+        "table": "Album",
+        "id": "AlbumId",
+        "label": "Title",
+        "fuzzy": ["Title"],
+        "document": 'COALESCE("Title", \'\')',
+    },
+    "artist": {
+        "table": "Artist",
+        "id": "ArtistId",
+        "label": "Name",
+        "fuzzy": ["Name"],
+        "document": 'COALESCE("Name", \'\')',
+    },
+}
+
+
+def tsvector(target):
+    return "to_tsvector('%s', %s)" % (TS_CONFIG, target["document"])
+
+
+def index_statements():
+    statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+    for target in TARGETS.values():
+        table = target["table"]
+        for column in target["fuzzy"]:
+            statements.append(
+                'CREATE INDEX IF NOT EXISTS "IX_%s%sTrgm" ON "%s" '
+                'USING gin ("%s" gin_trgm_ops)'
+                % (table, column, table, column)
+            )
+        statements.append(
+            'CREATE INDEX IF NOT EXISTS "IX_%sSearch" ON "%s" USING gin (%s)'
+            % (table, table, tsvector(target))
+        )
+    return statements
+
+
+def install(connection):
+    cursor = connection.cursor()
+    for statement in index_statements():
+        cursor.execute(statement)
+    for target in TARGETS.values():
+        cursor.execute('ANALYZE "%s"' % target["table"])
+    connection.commit()
+
+
+# the query matches a column when it is similar to any part of it
+# (word_similarity, the <% operator) or when all its words appear in the
+# document; the rank is the best of the two scores
+def target_sql(kind):
+    target = TARGETS[kind]
+    query = "plainto_tsquery('%s', %%(text)s)" % TS_CONFIG
+    scores = [
+        'word_similarity(%%(text)s, COALESCE("%s", \'\'))' % column
+        for column in target["fuzzy"]
+    ] + ["ts_rank(%s, %s)" % (tsvector(target), query)]
+    matches = [
+        '%%(text)s <%%%% "%s"' % column for column in target["fuzzy"]
+    ] + ["%s @@ %s" % (tsvector(target), query)]
+    return (
+        "SELECT '%s', \"%s\", \"%s\", GREATEST(%s) FROM \"%s\" WHERE %s" % (
+            kind, target["id"], target["label"], ", ".join(scores),
+            target["table"], " OR ".join(matches)
+        )
+    )
+
+
+def search(connection, text, kinds=None, limit=LIMIT):
+    sql = " UNION ALL ".join(
+        "(%s)" % target_sql(kind) for kind in (kinds or TARGETS)
+    )
+    cursor = connection.cursor()
+    cursor.execute(
+        "%s ORDER BY 4 DESC LIMIT %%(limit)s" % sql,
+        {"text": text, "limit": limit}
+    )
+    return [Result(*row) for row in cursor.fetchall()]
+
+
+# what search would look like without the indexes, for the benchmark
+def naive_search(connection, text, kinds=None, limit=LIMIT):
+    parts = []
+    for kind in kinds or TARGETS:
+        target = TARGETS[kind]
+        matches = " OR ".join(
+            '"%s" ILIKE %%(pattern)s' % column for column in target["fuzzy"]
+        )
+        parts.append(
+            "(SELECT '%s', \"%s\", \"%s\", 1.0 FROM \"%s\" WHERE %s)" % (
+                kind, target["id"], target["label"], target["table"], matches
+            )
+        )
+    cursor = connection.cursor()
+    cursor.execute(
+        "%s LIMIT %%(limit)s" % " UNION ALL ".join(parts),
+        {"pattern": "%" + text + "%", "limit": limit}
+    )
+    return [Result(*row) for row in cursor.fetchall()]
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+BENCHMARK_TERMS = ["queen", "mercury", "symphony", "led zepelin", "beethovn"]
+
+
+def benchmark(connection, terms=BENCHMARK_TERMS, repeat=10):
+    cursor = connection.cursor()
+    for term in terms:
+        indexed = best_of(lambda: search(connection, term), repeat)
+        # ILIKE '%...%' can use the trigram indexes too, so they are
+        # switched off for the naive run to measure the plain scan
+        cursor.execute("SET LOCAL enable_bitmapscan TO off")
+        cursor.execute("SET LOCAL enable_indexscan TO off")
+        naive = best_of(lambda: naive_search(connection, term), repeat)
+        connection.rollback()
+        hits = search(connection, term, limit=3)
+        print(
+            term,
+            "indexed %.3f ms" % (indexed * 1000),
+            "ilike %.3f ms" % (naive * 1000),
+            "x%.1f" % (naive / indexed if indexed else 0.0),
+            ", ".join(hit.label for hit in hits) or "(no match)",
+            sep=" | "
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fuzzy and full-text search over the Chinook catalog"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("install", help="create the search indexes")
+    command = commands.add_parser("query", help="search for some text")
+    command.add_argument("text")
+    command.add_argument(
+        "--kind", action="append", choices=sorted(TARGETS)
+    )
+    command.add_argument("--limit", type=int, default=LIMIT)
+    command = commands.add_parser(
+        "bench", help="compare indexed search with ILIKE scans"
+    )
+    command.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with raw_connection() as connection:
+        if args.command == "install":
+            install(connection)
+            print("search indexes created")
+        elif args.command == "query":
+            for result in search(
+                connection, args.text, args.kind, args.limit
+            ):
+                print(result.kind, result.id, result.label,
+                      "%.3f" % result.rank, sep=" | ")
+        else:
+            benchmark(connection, repeat=args.repeat)
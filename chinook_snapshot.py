@@ -0,0 +1,228 @@
+import argparse
+import time
+
+import numpy as np
+
+from chinook_db import raw_connection
+
+
+# numeric Track columns held as NumPy arrays; missing ids become -1 and a
+# missing Bytes value becomes 0
+NUMERIC_COLUMNS = [
+    ("TrackId", np.int64),
+    ("AlbumId", np.int64),
+    ("MediaTypeId", np.int64),
+    ("GenreId", np.int64),
+    ("Milliseconds", np.int64),
+    ("Bytes", np.int64),
+    ("UnitPrice", np.float64),
+]
+TEXT_COLUMNS = ["Name", "Composer"]
+MISSING = {"AlbumId": -1, "GenreId": -1, "MediaTypeId": -1, "Bytes": 0}
+
+GROUP_KEYS = ["GenreId", "MediaTypeId", "AlbumId"]
+
+
+# columnar in-memory copy of the Track table for analytics: one bulk fetch,
+# then group-by, filter and top-k all run vectorized in NumPy
+class TrackSnapshot:
+    def __init__(self, columns, genres=None, media_types=None):
+        self.columns = columns
+        self.genres = genres or {}
+        self.media_types = media_types or {}
+        self.loaded_at = time.time()
+
+    def __len__(self):
+        return len(self.columns["TrackId"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @classmethod
+    def load(cls, connection=None):
+        if connection is None:
+            with raw_connection() as connection:
+                return cls.load(connection)
+
+        names = [name for name, _ in NUMERIC_COLUMNS] + TEXT_COLUMNS
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT %s FROM "Track" ORDER BY "TrackId"'
+            % ", ".join('"%s"' % name for name in names)
+        )
+        rows = cursor.fetchall()
+        values = list(zip(*rows)) if rows else [()] * len(names)
+
+        columns = {}
+        for index, (name, dtype) in enumerate(NUMERIC_COLUMNS):
+            missing = MISSING.get(name, 0)
+            columns[name] = np.fromiter(
+                (missing if value is None else value
+                 for value in values[index]),
+                dtype=dtype,
+                count=len(rows)
+            )
+        for offset, name in enumerate(TEXT_COLUMNS):
+            columns[name] = np.array(
+                values[len(NUMERIC_COLUMNS) + offset], dtype=object
+            )
+
+        cursor.execute('SELECT "GenreId", "Name" FROM "Genre"')
+        genres = dict(cursor.fetchall())
+        cursor.execute('SELECT "MediaTypeId", "Name" FROM "MediaType"')
+        media_types = dict(cursor.fetchall())
+        return cls(columns, genres, media_types)
+
+    # reload everything from the database, in place
+    def refresh(self, connection=None):
+        fresh = self.load(connection)
+        self.columns = fresh.columns
+        self.genres = fresh.genres
+        self.media_types = fresh.media_types
+        self.loaded_at = fresh.loaded_at
+        return self
+
+    # boolean mask of the rows matching every condition, e.g.
+    # mask(GenreId=1) or mask(Milliseconds=lambda ms: ms > 300000)
+    def mask(self, **conditions):
+        selected = np.ones(len(self), dtype=bool)
+        for name, condition in conditions.items():
+            column = self.columns[name]
+            if callable(condition):
+                selected &= condition(column)
+            else:
+                selected &= column == condition
+        return selected
+
+    # a new snapshot holding only the rows of the mask (or conditions)
+    def filter(self, mask=None, **conditions):
+        if mask is None:
+            mask = self.mask(**conditions)
+        columns = dict(
+            (name, column[mask]) for name, column in self.columns.items()
+        )
+        subset = TrackSnapshot(columns, self.genres, self.media_types)
+        subset.loaded_at = self.loaded_at
+        return subset
+
+    # aggregate value per distinct key: returns (keys, results) arrays,
+    # agg is one of "sum", "mean", "count", "min" or "max"
+    def group_by(self, key, value=None, agg="sum", mask=None):
+        keys = self.columns[key]
+        values = self.columns[value] if value is not None else None
+        if mask is not None:
+            keys = keys[mask]
+            values = values[mask] if values is not None else None
+
+        groups, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(groups))
+        if agg == "count":
+            return groups, counts
+        if agg in ("sum", "mean"):
+            sums = np.bincount(
+                inverse, weights=values.astype(np.float64),
+                minlength=len(groups)
+            )
+            return groups, sums if agg == "sum" else sums / counts
+        if agg in ("min", "max"):
+            order = np.lexsort((values, inverse))
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            if agg == "min":
+                return groups, values[order][starts]
+            return groups, values[order][starts + counts - 1]
+        raise ValueError("unknown aggregate: %s" % agg)
+
+    # indexes of the k rows with the largest (or smallest) values, in order
+    def top_k(self, column, k=10, largest=True, mask=None):
+        values = self.columns[column]
+        positions = np.arange(len(values))
+        if mask is not None:
+            values = values[mask]
+            positions = positions[mask]
+        k = min(k, len(values))
+        if k == 0:
+            return positions[:0]
+        keys = -values if largest else values
+        best = np.argpartition(keys, k - 1)[:k]
+        return positions[best[np.argsort(keys[best], kind="stable")]]
+
+    def rows(self, positions, names=("TrackId", "Name", "Composer")):
+        return [
+            tuple(self.columns[name][position] for name in names)
+            for position in positions
+        ]
+
+
+# the same aggregations in SQL and in the snapshot, for comparison
+BENCHMARKS = [
+    (
+        "milliseconds_per_genre",
+        'SELECT "GenreId", SUM("Milliseconds") FROM "Track" '
+        'GROUP BY "GenreId"',
+        ("GenreId", "Milliseconds", "sum"),
+    ),
+    (
+        "bytes_per_media_type",
+        'SELECT "MediaTypeId", SUM("Bytes") FROM "Track" '
+        'GROUP BY "MediaTypeId"',
+        ("MediaTypeId", "Bytes", "sum"),
+    ),
+    (
+        "unit_price_per_album",
+        'SELECT "AlbumId", AVG("UnitPrice") FROM "Track" '
+        'GROUP BY "AlbumId"',
+        ("AlbumId", "UnitPrice", "mean"),
+    ),
+    (
+        "tracks_per_genre",
+        'SELECT "GenreId", COUNT(*) FROM "Track" GROUP BY "GenreId"',
+        ("GenreId", None, "count"),
+    ),
+]
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def benchmark(repeat=20):
+    with raw_connection() as connection:
+        started = time.perf_counter()
+        snapshot = TrackSnapshot.load(connection)
+        load_seconds = time.perf_counter() - started
+        print("load", "%d rows" % len(snapshot), "%.3fs" % load_seconds,
+              sep=" | ")
+
+        cursor = connection.cursor()
+        for name, sql, (key, value, agg) in BENCHMARKS:
+            def run_sql():
+                cursor.execute(sql)
+                cursor.fetchall()
+
+            def run_numpy():
+                snapshot.group_by(key, value, agg)
+
+            sql_seconds = best_of(run_sql, repeat)
+            numpy_seconds = best_of(run_numpy, repeat)
+            print(
+                name,
+                "sql %.3f ms" % (sql_seconds * 1000),
+                "numpy %.3f ms" % (numpy_seconds * 1000),
+                "x%.1f" % (sql_seconds / numpy_seconds
+                           if numpy_seconds else 0.0),
+                sep=" | "
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the NumPy Track snapshot against SQL"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    benchmark(args.repeat)
@@ -0,0 +1,273 @@
+import atexit
+import bisect
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from psycopg2.extensions import cursor as psycopg2_cursor
+from sqlalchemy import event
+
+import chinook_db
+
+
+# per-statement timing for both access paths: SQLAlchemy engine events
+# (before/after cursor execute) and a timed psycopg2 cursor class; every
+# statement is recorded under its normalized SQL, statements slower than
+# SLOW_QUERY_MS go to the "chinook.slow" log with their parameters, and a
+# JSON summary is written on exit
+#
+# turn it on with enable(), or with CHINOOK_TIMING=1 for the entry points
+# that check it (chinook_cli.py and chinook_bench.py)
+
+SLOW_QUERY_MS = float(os.environ.get("CHINOOK_SLOW_QUERY_MS", 100))
+SUMMARY_PATH = os.environ.get("CHINOOK_TIMING_SUMMARY")
+
+# upper bounds, in milliseconds, of the latency histogram buckets
+BUCKETS_MS = [
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000
+]
+
+slow_log = logging.getLogger("chinook.slow")
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w\"])-?\d+(?:\.\d+)?\b")
+# named :params, but not the type of a ::cast
+PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<!:):\w+|\?")
+VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+
+# one shape per query: literals and placeholders become ?, IN lists
+# collapse to (?...), whitespace is squeezed
+def normalize_sql(statement):
+    statement = STRING_LITERAL.sub("?", statement)
+    statement = PLACEHOLDER.sub("?", statement)
+    statement = NUMBER_LITERAL.sub("?", statement)
+    statement = VALUE_LIST.sub("(?...)", statement)
+    return WHITESPACE.sub(" ", statement).strip()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+    def add(self, elapsed_ms, rows=0):
+        self.counts[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if rows and rows > 0:
+            self.rows += rows
+
+    # approximate percentile: the upper bound of the bucket it falls in
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        wanted = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                if index < len(BUCKETS_MS):
+                    return min(BUCKETS_MS[index], self.max_ms)
+                return self.max_ms
+        return self.max_ms
+
+    def buckets(self):
+        labels = ["<=%g" % bound for bound in BUCKETS_MS]
+        labels.append(">%g" % BUCKETS_MS[-1])
+        return dict(
+            (label, count)
+            for label, count in zip(labels, self.counts) if count
+        )
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "total_ms": self.total_ms,
+            "mean_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_ms,
+            "rows": self.rows,
+            "buckets": self.buckets(),
+        }
+
+
+class StatementStats:
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.pool_waits = {}
+        self.slow = 0
+
+    def record(self, statement, parameters, elapsed, rows=0, source="sql"):
+        elapsed_ms = elapsed * 1000
+        key = normalize_sql(statement)
+        with self.lock:
+            histogram = self.statements.get(key)
+            if histogram is None:
+                histogram = self.statements[key] = Histogram()
+            histogram.add(elapsed_ms, rows)
+            if elapsed_ms >= self.slow_query_ms:
+                self.slow += 1
+        if elapsed_ms >= self.slow_query_ms:
+            slow_log.warning(
+                "%.1f ms [%s] %s params=%r",
+                elapsed_ms, source, WHITESPACE.sub(" ", statement).strip(),
+                parameters
+            )
+
+    def record_wait(self, pool_name, seconds):
+        with self.lock:
+            histogram = self.pool_waits.get(pool_name)
+            if histogram is None:
+                histogram = self.pool_waits[pool_name] = Histogram()
+            histogram.add(seconds * 1000)
+
+    def summary(self):
+        with self.lock:
+            statements = sorted(
+                self.statements.items(),
+                key=lambda item: item[1].total_ms,
+                reverse=True
+            )
+            return {
+                "slow_query_ms": self.slow_query_ms,
+                "slow_statements": self.slow,
+                "statements": [
+                    dict(histogram.summary(), sql=sql)
+                    for sql, histogram in statements
+                ],
+                "pool_wait": dict(
+                    (name, histogram.summary())
+                    for name, histogram in self.pool_waits.items()
+                ),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.pool_waits.clear()
+            self.slow = 0
+
+
+# shared statistics, filled by everything instrumented below
+stats = StatementStats()
+
+
+# SQLAlchemy: time every cursor execute of an engine
+def instrument_engine(engine, statement_stats=None):
+    statement_stats = statement_stats or stats
+
+    # start times are stacked per connection with the execution context
+    # they belong to, and popped when that statement ends, whether it
+    # succeeds (after_cursor_execute) or fails (handle_error)
+    def pop_started(conn, context):
+        started = conn.info.get("chinook_timing")
+        if started and started[-1][0] is context:
+            return started.pop()[1]
+        return None
+
+    def before_cursor_execute(conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info.setdefault("chinook_timing", []).append(
+            (context, time.perf_counter())
+        )
+
+    def after_cursor_execute(conn, cursor, statement, parameters,
+                             context, executemany):
+        started = pop_started(conn, context)
+        if started is not None:
+            statement_stats.record(
+                statement, parameters, time.perf_counter() - started,
+                cursor.rowcount, "sqlalchemy"
+            )
+
+    def handle_error(exception_context):
+        if exception_context.connection is not None:
+            pop_started(
+                exception_context.connection,
+                exception_context.execution_context
+            )
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+    return engine
+
+
+# psycopg2: a cursor class that times execute() and executemany(); use it
+# with connection.cursor(cursor_factory=TimedCursor) or instrument_connection
+class TimedCursor(psycopg2_cursor):
+    statement_stats = stats
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(query, vars, started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(query, "<executemany>", started)
+
+    def _record(self, query, vars, started):
+        if isinstance(query, bytes):
+            query = query.decode()
+        self.statement_stats.record(
+            str(query), vars, time.perf_counter() - started,
+            self.rowcount, "psycopg2"
+        )
+
+
+def instrument_connection(connection):
+    connection.cursor_factory = TimedCursor
+    return connection
+
+
+def write_summary(path=None):
+    summary = stats.summary()
+    summary["pools"] = chinook_db.pool_stats()
+    if path:
+        with open(path, "w") as output:
+            json.dump(summary, output, indent=2)
+    else:
+        json.dump(summary, sys.stderr, indent=2)
+        sys.stderr.write("\n")
+    return summary
+
+
+_enabled = False
+
+
+# instrument the shared engine and raw pool, and export the summary on exit
+# to summary_path (stderr when not given)
+def enable(slow_query_ms=None, summary_path=SUMMARY_PATH):
+    global _enabled
+    if slow_query_ms is not None:
+        stats.slow_query_ms = slow_query_ms
+    if _enabled:
+        return stats
+    _enabled = True
+    if not logging.getLogger().handlers and not slow_log.handlers:
+        logging.basicConfig(level=logging.WARNING)
+    instrument_engine(chinook_db.db)
+    chinook_db.RAW_CONNECTION_LISTENERS.append(instrument_connection)
+    chinook_db.WAIT_LISTENERS.append(stats.record_wait)
+    atexit.register(write_summary, summary_path)
+    return stats
@@ -1,9 +1,12 @@
 from sqlalchemy import (
-    create_engine, Column, Integer, String
+    Column, Integer, String
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from chinook_db import db
+from chinook_schema import ensure_schema
+
 # The reason that we no longer need to import the Table class, is because with the ORM,
 # we're not going to create tables, but instead, we'll be creating Python classes.
 # These Python classes that we'll create will subclass the declarative_base, meaning that
@@ -16,7 +19,7 @@ from sqlalchemy.orm import sessionmaker
 # of 'db', and use create_engine to point to our specific database location.
 
 # executing the instructions from the "chinook" database
-db = create_engine("postgresql:///chinook")
+# ("db" is the shared, pooled engine imported from chinook_db.py)
 base = declarative_base()
 # This new 'base' class will essentially grab the metadata that is produced by our database
 # table schema, and creates a subclass to map everything back to us here within the 'base' variable.
@@ -47,6 +50,11 @@ class Programmer(base):
     famous_for = Column(String)
 
 
+# the set-based update_genders() and delete_programmers() helpers live in
+# chinook_crud.py (imported in the examples below) so that chinook_cli.py
+# can use them too
+
+
 
 
 
@@ -71,7 +79,10 @@ session = Session()
 
 
 # creating the database using declarative_base subclass
-base.metadata.create_all(db)
+# base.metadata.create_all(db)
+# ensure_schema() does the same, but only the first time: the tables it
+# has seen are cached on disk, so later runs skip the catalog round trips
+ensure_schema(db, base.metadata)
 
 # The last thing we need to do before we can work with our database, is to actually create
 # the database subclass and generate all metadata. The base variable, given that it's a subclass
@@ -203,6 +214,11 @@ willy_wonka = Programmer(
 #         print("Gender not defined")
 #     session.commit()
 
+# updating multiple records in one statement and one transaction
+# from chinook_crud import update_genders
+# updated = update_genders(session)
+# print("Programmers updated: ", updated)
+
 
 # deleting a single record
 # fname = input("Enter a first name: ")
@@ -228,6 +244,11 @@ willy_wonka = Programmer(
 #     session.delete(programmer)
 #     session.commit()
 
+# delete multiple/all records in one statement and one transaction
+# from chinook_crud import delete_programmers
+# deleted = delete_programmers(session)
+# print("Programmers deleted: ", deleted)
+
 
 # Before we start to add more Programmers to our table, let's make sure that Ada is added correctly.
 # This is where the 'R' in CRUD comes back into
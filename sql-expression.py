@@ -1,14 +1,23 @@
-from sqlalchemy import (
-    create_engine, Table, Column, Float, ForeignKey, Integer, String, MetaData
-)
+from chinook_db import db
+from chinook_schema import load_metadata
 
 
 # executing the instructions from our localhost "chinook" db
-db = create_engine("postgresql:///chinook")
+# ("db" is the shared, pooled engine imported from chinook_db.py)
 # Next, we need to link our Python file to our Chinook database, and that's where the 'create_engine'
 # component comes into play.
 
-meta = MetaData(db)
+# The tables used to be declared by hand below (their ForeignKeys pointed at
+# "artist_table.ArtistId" and "album_table.AlbumId", which are Python
+# variable names, not tables). Now every Chinook table is reflected from the
+# database once and cached on disk by chinook_schema.py, keyed by a
+# fingerprint of the schema, so later runs load it with one catalog query.
+meta = load_metadata(db)
+artist_table = meta.tables["Artist"]
+album_table = meta.tables["Album"]
+track_table = meta.tables["Track"]
+
+# meta = MetaData(db)
 # The MetaData class will contain a collection of our table objects, and the associated data
 # within those objects.
 
@@ -17,11 +26,11 @@ meta = MetaData(db)
 # Using the Table import, we need to specify the name of our table, and provide the meta schema.
 # Now, all that's left to do is provide a breakdown of each of the columns within this table.
 # Table () taken from import
-artist_table = Table(
-    "Artist", meta,
-    Column("ArtistId", Integer, primary_key=True),
-    Column("Name", String)
-)
+# artist_table = Table(
+#     "Artist", meta,
+#     Column("ArtistId", Integer, primary_key=True),
+#     Column("Name", String)
+# )
 # Back within our file, the format when defining columns, is the column name, followed by the
 # type of data presented, and then any other optional fields after that.
 # In our case, we have a column for "ArtistId", which is an Integer, and for this one, we
@@ -33,26 +42,26 @@ artist_table = Table(
 # to create variables for the Album and Track tables.
 
 # create variable for "Album" table
-album_table = Table(
-    "Album", meta,
-    Column("AlbumId", Integer, primary_key=True),
-    Column("Title", String),
-    Column("ArtistId", Integer, ForeignKey("artist_table.ArtistId"))
-)
+# album_table = Table(
+#     "Album", meta,
+#     Column("AlbumId", Integer, primary_key=True),
+#     Column("Title", String),
+#     Column("ArtistId", Integer, ForeignKey("artist_table.ArtistId"))
+# )
 
 # create variable for "Track" table
-track_table = Table(
-    "Track", meta,
-    Column("TrackId", Integer, primary_key=True),
-    Column("Name", String),
-    Column("AlbumId", Integer, ForeignKey("album_table.AlbumId")),
-    Column("MediaTypeId", Integer, primary_key=False),
-    Column("GenreId", Integer, primary_key=False),
-    Column("Composer", String),
-    Column("Milliseconds", Integer),
-    Column("Bytes", Integer),
-    Column("UnitPrice", Float)
-)
+# track_table = Table(
+#     "Track", meta,
+#     Column("TrackId", Integer, primary_key=True),
+#     Column("Name", String),
+#     Column("AlbumId", Integer, ForeignKey("album_table.AlbumId")),
+#     Column("MediaTypeId", Integer, primary_key=False),
+#     Column("GenreId", Integer, primary_key=False),
+#     Column("Composer", String),
+#     Column("Milliseconds", Integer),
+#     Column("Bytes", Integer),
+#     Column("UnitPrice", Float)
+# )
 
 # making the connection
 with db.connect() as connection:
@@ -96,6 +105,14 @@ with db.connect() as connection:
     select_query = track_table.select().where(track_table.c.Composer == "Queen")
 
     results = connection.execute(select_query)
+
+    # Queries 3, 4 and 5 again, through server-side prepared statements that
+    # are parsed and planned once per pooled connection
+    # from chinook_prepared import prepared
+    # results = prepared.execute_core(connection, "artist_by_name", ["Queen"])
+    # results = prepared.execute_core(connection, "artist_by_id", [51])
+    # results = prepared.execute_core(connection, "albums_by_artist", [51])
+
     for result in results:
         print(result)
 
@@ -1,11 +1,12 @@
 from sqlalchemy import (
-    create_engine, Column, Integer, String
+    Column, Integer, String
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from chinook_db import db
+from chinook_schema import ensure_schema
 
-db = create_engine("postgresql:///chinook")
 base = declarative_base()
 
 class FavoriteCountries(base):
@@ -22,7 +23,8 @@ Session = sessionmaker(db)
 
 session = Session()
 
-base.metadata.create_all(db)
+# create the table once; later runs find it in the chinook_schema cache
+ensure_schema(db, base.metadata)
 
 
 ukraine = FavoriteCountries(
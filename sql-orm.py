@@ -1,8 +1,12 @@
 from sqlalchemy import (
-    create_engine, Column, Float, ForeignKey, Integer, String
+    Column, Float, ForeignKey, Integer, String
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import relationship, sessionmaker
+
+from chinook_db import db
+from chinook_models import iter_rows
+from chinook_schema import ensure_schema
 
 # The reason that we no longer need to import the Table class, is because with the ORM,
 # we're not going to create tables, but instead, we'll be creating Python classes.
@@ -16,7 +20,7 @@ from sqlalchemy.orm import sessionmaker
 # of 'db', and use create_engine to point to our specific database location.
 
 # executing the instructions from the "chinook" database
-db = create_engine("postgresql:///chinook")
+# ("db" is the shared, pooled engine imported from chinook_db.py)
 base = declarative_base()
 # This new 'base' class will essentially grab the metadata that is produced by our database
 # table schema, and creates a subclass to map everything back to us here within the 'base' variable.
@@ -36,6 +40,7 @@ class Artist(base):
     __tablename__ = "Artist"
     ArtistId = Column(Integer, primary_key=True)
     Name = Column(String)
+    albums = relationship("Album", back_populates="artist")
 # We're going to call our first class 'Artist', and define the __tablename__, wrapped in two
 # underscores, which will be set to "Artist" as a string.
 # Just a quick note for best practice, when defining your classes in Python, it's best
@@ -51,6 +56,8 @@ class Album(base):
     AlbumId = Column(Integer, primary_key=True)
     Title = Column(String)
     ArtistId = Column(Integer, ForeignKey("Artist.ArtistId"))
+    artist = relationship("Artist", back_populates="albums")
+    tracks = relationship("Track", back_populates="album")
 
 
 # create a class-based model for the "Track" table
@@ -65,6 +72,11 @@ class Track(base):
     Milliseconds = Column(Integer, primary_key=False)
     Bytes = Column(Integer, primary_key=False)
     UnitPrice = Column(Float)
+    album = relationship("Album", back_populates="tracks")
+
+# The relationship() attributes let us walk from an artist to its albums and
+# from an album to its tracks. On their own they load lazily, one query per
+# parent (the N+1 pattern), so Query 7 below asks for select-in loading.
 
 
 
@@ -93,7 +105,10 @@ session = Session()
 
 
 # creating the database using declarative_base subclass
-base.metadata.create_all(db)
+# base.metadata.create_all(db)
+# ensure_schema() does the same, but only the first time: the tables it
+# has seen are cached on disk, so later runs skip the catalog round trips
+ensure_schema(db, base.metadata)
 
 # The last thing we need to do before we can work with our database, is to actually create
 # the database subclass and generate all metadata. The base variable, given that it's a subclass
@@ -141,8 +156,44 @@ print(artist.ArtistId, artist.Name, sep=" | ")
 # for album in albums:
 #     print(album.AlbumId, album.Title, album.ArtistId, sep=" | ")
 
+# Queries 3, 4 and 5 again, through server-side prepared statements that
+# are parsed and planned once per pooled connection
+# from chinook_prepared import prepared
+# artist = prepared.query_orm(session, Artist, "artist_by_name", ["Queen"]).first()
+# artist = prepared.query_orm(session, Artist, "artist_by_id", [51]).first()
+# albums = prepared.query_orm(session, Album, "albums_by_artist", [51])
+
+# Queries 3, 4 and 5 again, through the read-through catalog cache, which
+# only goes to the database on a miss (the rows are plain column tuples)
+# from chinook_cache import catalog
+# artist = catalog.find(Artist, Name="Queen")[0]
+# artist = catalog.get(Artist, 51)
+# albums = catalog.find(Album, ArtistId=51)
+
 # Query 6 - select all tracks where the composer is "Queen" from the "Track" table
-tracks = session.query(Track).filter_by(Composer="Queen")
+# tracks = session.query(Track).filter_by(Composer="Queen")
+# for track in tracks:
+#     print(
+#         track.TrackId,
+#         track.Name,
+#         track.AlbumId,
+#         track.MediaTypeId,
+#         track.GenreId,
+#         track.Composer,
+#         track.Milliseconds,
+#         track.Bytes,
+#         track.UnitPrice,
+#         sep=" | "
+#     )
+
+# Query 6, read-only - the same tracks, but only the printed columns are
+# loaded, in chunks, as plain rows instead of identity-mapped Track objects
+tracks = iter_rows(
+    session, Track,
+    ["TrackId", "Name", "AlbumId", "MediaTypeId", "GenreId", "Composer",
+     "Milliseconds", "Bytes", "UnitPrice"],
+    Composer="Queen"
+)
 for track in tracks:
     print(
         track.TrackId,
@@ -155,4 +206,17 @@ for track in tracks:
         track.Bytes,
         track.UnitPrice,
         sep=" | "
-    )
\ No newline at end of file
+    )
+
+
+# Query 7 - the whole discography of "ArtistId" #51, albums and tracks
+# loaded up front in three statements instead of one per album
+# from sqlalchemy.orm import selectinload
+# artist = (
+#     session.query(Artist)
+#     .options(selectinload(Artist.albums).selectinload(Album.tracks))
+#     .filter_by(ArtistId=51)
+#     .first()
+# )
+# for album in artist.albums:
+#     print(album.AlbumId, album.Title, len(album.tracks), sep=" | ")
@@ -1,41 +1,84 @@
-import psycopg2
+from chinook_db import get_raw_pool
 
-# connect to "chinook" database
-connection = psycopg2.connect(database="chinook")
+# set to True to stream the results through a server-side cursor
+# instead of loading the whole result into memory with fetchall()
+STREAMING = False
 
-# build a cursor object of the database
-cursor = connection.cursor()
+# number of rows fetched from the server per round trip when streaming
+BATCH_SIZE = 1000
 
-# Query 1 - select all records from the "Artist" table
-# cursor.execute('SELECT * FROM "Artist"')
 
-# Query 2 - select only the "Name" column from the "Artist" table
-# cursor.execute('SELECT "Name" FROM "Artist"')
+# a named cursor keeps the result set on the server, and fetchmany() only
+# brings over one batch at a time, so memory stays bounded and the first
+# row is available as soon as the first batch arrives
+def stream_results(connection, query, params=None, batch_size=BATCH_SIZE):
+    with connection.cursor(name="chinook_stream") as cursor:
+        cursor.itersize = batch_size
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
 
-# Query 3 - select only "Queen" from the "Artist" table
-# cursor.execute('SELECT * FROM "Artist" WHERE "Name" = %s', ["Queen"])
 
-# Query 4 - select only by "ArtistId" #51 from the "Artist" table
-# cursor.execute('SELECT * FROM "Artist" WHERE "ArtistId" = %s', [51])
+# borrow a connection to the "chinook" database from the shared pool
+pool = get_raw_pool()
+connection = pool.getconn()
 
-# Query 5 - select only the albums with "ArtistId" #51 on the "Album" table
-# cursor.execute('SELECT * FROM "Album" WHERE "ArtistId" = %s', [51])
+if STREAMING:
+    # Query 7 - stream all records from the "Track" table
+    results = stream_results(connection, 'SELECT * FROM "Track"')
 
-# Query 6 - select all tracks where the composer is "Queen" from the "Track" table
-# cursor.execute('SELECT * FROM "Track" WHERE "Composer" = %s', ["Queen"])
+    # Query 8 - stream all records from the "PlaylistTrack" table
+    # results = stream_results(connection, 'SELECT * FROM "PlaylistTrack"')
 
-# fetch the results (multiple)
-results = cursor.fetchall()
+    # print results as they arrive, then return the connection
+    for result in results:
+        print(result)
+    connection.rollback()
+    pool.putconn(connection)
 
-# fetch the result (single)
-# results = cursor.fetchone()
+else:
+    # build a cursor object of the database
+    cursor = connection.cursor()
 
-# close the connection
-connection.close()
+    # Query 1 - select all records from the "Artist" table
+    # cursor.execute('SELECT * FROM "Artist"')
 
-# print results
-for result in results:
-    print(result)
+    # Query 2 - select only the "Name" column from the "Artist" table
+    # cursor.execute('SELECT "Name" FROM "Artist"')
 
+    # Query 3 - select only "Queen" from the "Artist" table
+    # cursor.execute('SELECT * FROM "Artist" WHERE "Name" = %s', ["Queen"])
 
+    # Query 4 - select only by "ArtistId" #51 from the "Artist" table
+    # cursor.execute('SELECT * FROM "Artist" WHERE "ArtistId" = %s', [51])
 
+    # Query 5 - select only the albums with "ArtistId" #51 on the "Album" table
+    # cursor.execute('SELECT * FROM "Album" WHERE "ArtistId" = %s', [51])
+
+    # Queries 3, 4 and 5 again, through server-side prepared statements that
+    # are parsed and planned once per pooled connection
+    # from chinook_prepared import prepared
+    # prepared.execute(cursor, "artist_by_name", ["Queen"])
+    # prepared.execute(cursor, "artist_by_id", [51])
+    # prepared.execute(cursor, "albums_by_artist", [51])
+
+    # Query 6 - select all tracks where the composer is "Queen" from the "Track" table
+    # cursor.execute('SELECT * FROM "Track" WHERE "Composer" = %s', ["Queen"])
+
+    # fetch the results (multiple)
+    results = cursor.fetchall()
+
+    # fetch the result (single)
+    # results = cursor.fetchone()
+
+    # return the connection to the pool
+    connection.rollback()
+    pool.putconn(connection)
+
+    # print results
+    for result in results:
+        print(result)
@@ -0,0 +1,39 @@
+from chinook_bench import benchmark, orm_first
+
+
+# a layer whose only query returns two rows, logging its calls
+class FakeLayer:
+    name = "fake"
+
+    def __init__(self):
+        self.calls = []
+        self.queries = {"two_rows": lambda: [(1,), (2,)]}
+
+    def run(self, query):
+        self.calls.append("run")
+        return query()
+
+    def reset(self):
+        self.calls.append("reset")
+
+
+def test_benchmark_resets_after_every_run():
+    layer = FakeLayer()
+    result = benchmark(layer, "two_rows", warmup=2, repeat=3)
+    # warmup, measured and peak memory runs, each followed by a reset
+    assert layer.calls == ["run", "reset"] * 6
+    assert result["rows"] == 2
+    assert result["repeat"] == 3
+
+
+class FirstQuery:
+    def __init__(self, row):
+        self.row = row
+
+    def first(self):
+        return self.row
+
+
+def test_orm_first_counts_a_missing_row_as_none():
+    assert orm_first(FirstQuery(None)) == []
+    assert orm_first(FirstQuery("Queen")) == ["Queen"]
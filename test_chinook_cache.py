@@ -0,0 +1,36 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from chinook_cache import CatalogCache
+from chinook_models import Artist, Genre, base
+
+
+def test_every_watching_cache_is_invalidated():
+    engine = create_engine("sqlite://")
+    base.metadata.create_all(engine)
+    factory = sessionmaker(engine)
+    session = factory()
+    session.add(Artist(ArtistId=1, Name="AC/DC"))
+    session.commit()
+
+    caches = [
+        CatalogCache(models=(Artist, Genre), session_factory=factory)
+        .watch(factory)
+        for _ in range(2)
+    ]
+    for cache in caches:
+        assert cache.get(Artist, 1).Name == "AC/DC"
+
+    session.get(Artist, 1).Name = "Accept"
+    session.commit()
+    for cache in caches:
+        assert cache.invalidations == 1
+        assert cache.get(Artist, 1).Name == "Accept"
+
+    session.get(Artist, 1).Name = "Aerosmith"
+    session.flush()
+    session.rollback()
+    for cache in caches:
+        assert cache.invalidations == 1
+    session.close()
+    engine.dispose()
@@ -0,0 +1,23 @@
+import pytest
+
+from chinook_cli import full_name, main
+
+
+@pytest.mark.parametrize("argv, option", [
+    (["programmers", "add"], "--first-name, --last-name"),
+    (["programmers", "add", "--first-name", "Ada"], "--last-name"),
+    (["countries", "add", "--capital", "Paris"], "--name"),
+    (["countries", "delete"], "--id"),
+])
+def test_missing_required_options_are_rejected(argv, option, capsys):
+    with pytest.raises(SystemExit) as error:
+        main(argv)
+    assert error.value.code == 2
+    assert "requires %s" % option in capsys.readouterr().err
+
+
+def test_full_name_skips_null_names():
+    assert full_name("Ada", "Lovelace") == "Ada Lovelace"
+    assert full_name(None, "Lovelace") == "Lovelace"
+    assert full_name("Ada", None) == "Ada"
+    assert full_name(None, None) == ""
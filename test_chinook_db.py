@@ -0,0 +1,92 @@
+import psycopg2.extensions
+import psycopg2.pool
+
+from chinook_db import RawPool
+
+
+class FakeCursor:
+    def execute(self, sql):
+        pass
+
+    def close(self):
+        pass
+
+
+# enough of a psycopg2 connection for the pool: idle, closable, pingable
+class FakeConnection:
+    class info:
+        transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def __init__(self):
+        self.closed = 0
+
+    def cursor(self):
+        return FakeCursor()
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def fake_pool(monkeypatch, **kwargs):
+    opened = []
+
+    def connect(*args, **kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+
+    monkeypatch.setattr(psycopg2.pool.psycopg2, "connect", connect)
+    return RawPool(**kwargs), opened
+
+
+def test_raw_pool_keeps_minconn_connections_warm(monkeypatch):
+    pool, opened = fake_pool(monkeypatch, minconn=3, maxconn=5)
+    assert len(opened) == 3
+    connections = [pool.getconn() for _ in range(3)]
+    for connection in connections:
+        pool.putconn(connection)
+    assert not any(connection.closed for connection in opened)
+    assert len(opened) == 3
+    assert pool.stats()["checked_in"] == 3
+
+
+def test_raw_pool_forgets_closed_connections(monkeypatch):
+    pool, opened = fake_pool(monkeypatch, minconn=1, maxconn=3)
+    first, second = pool.getconn(), pool.getconn()
+    assert set(pool.pool.created) == {id(first), id(second)}
+    pool.putconn(first)
+    # only minconn connections stay idle, the second one is closed
+    pool.putconn(second)
+    assert second.closed
+    assert set(pool.pool.created) == {id(first)}
+    pool.closeall()
+    assert pool.pool.created == {}
+
+
+def test_raw_pool_recycles_by_creation_time(monkeypatch):
+    pool, opened = fake_pool(monkeypatch, minconn=1, maxconn=2)
+    connection = pool.getconn()
+    pool.putconn(connection)
+    # the age counts from when the connection was opened, not first used
+    pool.pool.created[id(connection)] -= pool.recycle + 1
+    replacement = pool.getconn()
+    assert replacement is not connection
+    assert connection.closed
+    assert set(pool.pool.created) == {id(replacement)}
+    pool.putconn(replacement)
+
+
+def test_raw_pool_stats_follow_its_own_size(monkeypatch):
+    pool, opened = fake_pool(monkeypatch, minconn=2, maxconn=4)
+    connections = [pool.getconn() for _ in range(3)]
+    stats = pool.stats()
+    assert stats["size"] == 2
+    assert stats["checked_out"] == 3
+    assert stats["overflow"] == 1
+    for connection in connections:
+        pool.putconn(connection)
+    stats = pool.stats()
+    assert stats["checked_in"] == 2
+    assert stats["overflow"] == 0
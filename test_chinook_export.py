@@ -0,0 +1,136 @@
+import csv
+import io
+from collections import namedtuple
+from decimal import Decimal
+
+import psycopg2
+import pytest
+
+from chinook_db import DATABASE
+from chinook_export import export_csv, export_parquet
+
+
+ROWS = [
+    [1, "For Those About To Rock", "Angus Young, Malcolm Young"],
+    [2, "Balls to the Wall", ""],
+    [3, "Motörhead", "line one\nline two"],
+]
+
+
+# stands in for psycopg2's copy_expert(COPY ... TO STDOUT): one write() per
+# row, bytes unless the target is an io.TextIOBase, as in _psycopg
+class CopyCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def copy_expert(self, sql, file):
+        for row in self.rows:
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerow(row)
+            data = buffer.getvalue()
+            if not isinstance(file, io.TextIOBase):
+                data = data.encode("utf-8")
+            file.write(data)
+
+
+def read_parts(paths):
+    rows = []
+    for path in paths:
+        with open(path, encoding="utf-8", newline="") as part:
+            reader = csv.reader(part)
+            assert next(reader) == ["TrackId", "Name", "Composer"]
+            rows.extend(reader)
+    return rows
+
+
+def test_export_csv_writes_chunked_parts(tmp_path):
+    (tmp_path / "Track").mkdir()
+    rows, paths = export_csv(
+        CopyCursor(ROWS), "SELECT 1", str(tmp_path), "Track", "stamp",
+        ["TrackId", "Name", "Composer"], chunk_rows=2
+    )
+    assert rows == 3
+    assert len(paths) == 2
+    assert read_parts(paths) == [[str(value) for value in row]
+                                 for row in ROWS]
+
+
+def test_export_csv_postgres(tmp_path):
+    try:
+        connection = psycopg2.connect(database=DATABASE)
+    except psycopg2.OperationalError:
+        pytest.skip("no PostgreSQL database %r to export from" % DATABASE)
+    (tmp_path / "Track").mkdir()
+    try:
+        sql = " UNION ALL ".join(
+            "SELECT %d, '%s', '%s'" % (
+                row[0], row[1].replace("'", "''"), row[2].replace("'", "''")
+            )
+            for row in ROWS
+        )
+        rows, paths = export_csv(
+            connection.cursor(), sql, str(tmp_path), "Track", "stamp",
+            ["TrackId", "Name", "Composer"], chunk_rows=2
+        )
+    finally:
+        connection.close()
+    assert rows == 3
+    assert read_parts(paths) == [[str(value) for value in row]
+                                 for row in ROWS]
+
+
+# the parts of psycopg2's description that export_parquet() reads
+Column = namedtuple("Column", ["name", "type_code", "precision", "scale"])
+
+
+# a named (server-side) cursor over fixed rows
+class NamedCursor:
+    def __init__(self, rows, description):
+        self.rows = list(rows)
+        self.columns = description
+        self.description = None
+
+    def execute(self, sql):
+        pass
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        self.description = self.columns
+        return batch
+
+    def close(self):
+        pass
+
+
+class NamedCursorConnection:
+    def __init__(self, rows, description):
+        self.named = NamedCursor(rows, description)
+
+    def cursor(self, name):
+        return self.named
+
+
+def test_export_parquet_parts_share_one_schema(tmp_path):
+    parquet = pytest.importorskip("pyarrow.parquet")
+    description = [
+        Column("TrackId", 23, None, None),
+        Column("Composer", 1043, None, None),
+        Column("UnitPrice", 1700, 10, 2),
+    ]
+    rows = [
+        (1, "Angus Young", Decimal("0.99")),
+        (2, "Queen", Decimal("1.99")),
+        # the second part has no composer at all
+        (3, None, Decimal("0.99")),
+    ]
+    (tmp_path / "Track").mkdir()
+    exported, paths = export_parquet(
+        NamedCursorConnection(rows, description), "SELECT 1", str(tmp_path),
+        "Track", "stamp", ["TrackId", "Composer", "UnitPrice"], chunk_rows=2
+    )
+    assert exported == 3
+    schemas = [parquet.read_schema(path) for path in paths]
+    assert len(schemas) == 2
+    assert schemas[0].equals(schemas[1])
+    assert str(schemas[1].field("Composer").type) == "string"
+    assert str(schemas[1].field("UnitPrice").type) == "decimal128(10, 2)"
@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from chinook_models import (
+    DISCOGRAPHY_STATEMENTS, LOADERS, Album, Artist, Genre, MediaType, Track,
+    base, count_statements, discography
+)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    base.metadata.create_all(engine)
+    session = sessionmaker(engine)()
+    genres = [Genre(GenreId=id, Name="Genre %d" % id) for id in (1, 2)]
+    media_types = [
+        MediaType(MediaTypeId=id, Name="Type %d" % id) for id in (1, 2)
+    ]
+    session.add_all(genres + media_types)
+    for artist_id in (1, 2):
+        artist = Artist(ArtistId=artist_id, Name="Artist %d" % artist_id)
+        for number in range(3):
+            album = Album(Title="Album %d" % number, artist=artist)
+            album.tracks = [
+                Track(
+                    Name="Track %d" % track, genre=genres[track % 2],
+                    media_type=media_types[(track // 2) % 2]
+                )
+                for track in range(4)
+            ]
+        session.add(artist)
+    session.commit()
+    session.close()
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("strategy", sorted(LOADERS))
+def test_discography_statement_bound(engine, strategy):
+    session = sessionmaker(engine)()
+    try:
+        with count_statements(engine) as statements:
+            artist = discography(session, 1, strategy)
+            tracks = [
+                (track.Name, track.genre.Name, track.media_type.Name)
+                for album in artist.albums
+                for track in album.tracks
+            ]
+        assert len(statements) <= DISCOGRAPHY_STATEMENTS, statements
+    finally:
+        session.close()
+    assert artist.Name == "Artist 1"
+    assert len(artist.albums) == 3
+    assert len(tracks) == 12
+    assert set(genre for _, genre, _ in tracks) == {"Genre 1", "Genre 2"}
+
+
+def test_discography_missing_artist(engine):
+    session = sessionmaker(engine)()
+    try:
+        assert discography(session, 99) is None
+    finally:
+        session.close()
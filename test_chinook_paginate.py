@@ -0,0 +1,44 @@
+from chinook_paginate import decode_cursor, paginate_psycopg2
+
+
+# returns the rows it is given, with a description of the selected columns
+class SelectCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.sql = None
+
+    def execute(self, sql, params):
+        self.sql = sql
+        select_list = sql[len("SELECT "):sql.index(" FROM ")]
+        self.description = [
+            (name.strip().strip('"'),) for name in select_list.split(",")
+        ]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class SelectConnection:
+    def __init__(self, rows):
+        self.selected = SelectCursor(rows)
+
+    def cursor(self):
+        return self.selected
+
+
+def test_paginate_psycopg2_selects_left_out_sort_columns():
+    connection = SelectConnection([("AC/DC", 1), ("Accept", 2), ("Aero", 3)])
+    page = paginate_psycopg2(
+        connection, "Artist", order_by=["Name", "ArtistId"], page_size=2,
+        columns=["Name"]
+    )
+    assert connection.selected.sql.startswith(
+        'SELECT "Name", "ArtistId" FROM "Artist"'
+    )
+    assert page.rows == [("AC/DC", 1), ("Accept", 2)]
+    assert decode_cursor(page.next_cursor, ["Name", "ArtistId"]) == [
+        "Accept", 2
+    ]
@@ -0,0 +1,106 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from chinook_models import Playlist, base
+from chinook_playlists import PlaylistIndex
+
+
+# answers the two queries of PlaylistIndex from a list of
+# ("PlaylistId", "TrackId") pairs
+class PairsCursor:
+    def __init__(self, pairs):
+        self.pairs = sorted(pairs)
+        self.rows = []
+
+    def execute(self, sql, params=()):
+        if "COUNT(*)" in sql:
+            checksums = {}
+            for playlist, track in self.pairs:
+                checksum = checksums.setdefault(playlist, [0, 0, 0])
+                checksum[0] += 1
+                checksum[1] += track
+                checksum[2] += track * track
+            self.rows = [
+                (playlist,) + tuple(checksum)
+                for playlist, checksum in checksums.items()
+            ]
+        else:
+            wanted = set(params[0]) if params else None
+            self.rows = [
+                pair for pair in self.pairs
+                if wanted is None or pair[0] in wanted
+            ]
+
+    def fetchall(self):
+        return self.rows
+
+
+class PairsConnection:
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def cursor(self):
+        return PairsCursor(self.pairs)
+
+
+PAIRS = [
+    (1, 10), (1, 20), (1, 30),
+    (2, 20), (2, 30), (2, 40),
+    # track ids far apart cost no more than close ones
+    (3, 30), (3, 50000000),
+]
+
+
+def as_lists(index):
+    return (
+        dict((key, ids.tolist()) for key, ids in index.playlists.items()),
+        dict((key, ids.tolist()) for key, ids in index.tracks.items()),
+    )
+
+
+def test_playlist_index_queries():
+    index = PlaylistIndex.load(PairsConnection(PAIRS))
+    assert index.contains(1, 20) and not index.contains(1, 40)
+    assert index.tracks_of(3).tolist() == [30, 50000000]
+    assert index.size(2) == 3
+    assert index.shared_tracks(1, 2).tolist() == [20, 30]
+    assert index.shared_tracks(1, 2, 3).tolist() == [30]
+    assert index.playlists_with([10, 40]).tolist() == [1, 2]
+    assert index.playlists_with([20, 30], every=True).tolist() == [1, 2]
+    assert index.similarity(1, 2) == 0.5
+    assert index.most_similar(1, k=1) == [(2, 0.5)]
+    assert index.stats()["memberships"] == 8
+
+
+def test_playlist_index_refresh_reloads_changed_playlists():
+    pairs = list(PAIRS)
+    index = PlaylistIndex.load(PairsConnection(pairs))
+    pairs.remove((1, 10))
+    pairs.append((4, 10))
+    pairs.remove((3, 50000000))
+    assert index.refresh(PairsConnection(pairs)) == [1, 3, 4]
+    assert as_lists(index) == as_lists(
+        PlaylistIndex.load(PairsConnection(pairs))
+    )
+    assert index.tracks[10].tolist() == [4]
+    assert 50000000 not in index.tracks
+
+
+def test_every_watching_index_reloads_written_playlists():
+    engine = create_engine("sqlite://")
+    base.metadata.create_all(engine)
+    factory = sessionmaker(engine)
+    indexes = [PlaylistIndex().watch(factory) for _ in range(2)]
+    reloaded = []
+    for index in indexes:
+        # record instead of reading "PlaylistTrack" from PostgreSQL
+        index.refresh_playlists = lambda ids, index=index: reloaded.append(
+            (index, sorted(ids))
+        )
+
+    session = factory()
+    session.add(Playlist(PlaylistId=7, Name="Grunge"))
+    session.commit()
+    session.close()
+    engine.dispose()
+    assert reloaded == [(index, [7]) for index in indexes]
@@ -0,0 +1,64 @@
+from chinook_rollups import GUARDED_TABLES, refresh
+
+
+# records every statement of a refresh; the catalog reports the tables in
+# guarded as already having their watermark trigger
+class RecordingCursor:
+    def __init__(self, guarded):
+        self.guarded = guarded
+        self.statements = []
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        if "FROM pg_trigger" in sql:
+            self.rows = [(table,) for table in self.guarded]
+        else:
+            self.rows = [(0,)]
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0]
+
+
+class RecordingConnection:
+    def __init__(self, guarded=()):
+        self.recording = RecordingCursor(guarded)
+        self.committed = False
+
+    def cursor(self):
+        return self.recording
+
+    def commit(self):
+        self.committed = True
+
+
+def position(statements, text):
+    return next(
+        number for number, sql in enumerate(statements) if text in sql
+    )
+
+
+def test_refresh_installs_watermark_guards_before_locking():
+    connection = RecordingConnection()
+    assert refresh(connection) == (0, 0)
+    statements = connection.recording.statements
+    locked = position(statements, "FOR UPDATE")
+    for table in GUARDED_TABLES:
+        trigger = position(
+            statements, 'CREATE TRIGGER "TR_%sRollupWatermark"' % table
+        )
+        assert trigger < locked
+    assert position(statements, '"RollupWatermarkGuard"() RETURNS') < locked
+    assert connection.committed
+
+
+def test_refresh_keeps_existing_watermark_guards():
+    connection = RecordingConnection(guarded=GUARDED_TABLES)
+    refresh(connection)
+    assert not any(
+        "TRIGGER" in sql or "FUNCTION" in sql
+        for sql in connection.recording.statements
+    )
@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from chinook_timing import StatementStats, instrument_engine, normalize_sql
+
+
+def test_normalize_sql_placeholders_and_literals():
+    assert normalize_sql(
+        'SELECT *  FROM "Track"\n WHERE "TrackId" IN (1, 2, 3) '
+        'AND "Name" = \'It\'\'s\' AND "AlbumId" = %(album)s'
+    ) == 'SELECT * FROM "Track" WHERE "TrackId" IN (?...) ' \
+        'AND "Name" = ? AND "AlbumId" = ?'
+    assert normalize_sql('SELECT :name, $1, ?') == 'SELECT ?, ?, ?'
+
+
+def test_normalize_sql_keeps_casts():
+    assert normalize_sql(
+        "SELECT '2009-01-01'::date, %(start)s::date, \"Total\"::numeric"
+    ) == 'SELECT ?::date, ?::date, "Total"::numeric'
+
+
+def test_failed_statements_leave_no_start_time_behind():
+    engine = instrument_engine(create_engine("sqlite://"), StatementStats())
+    with engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql('SELECT * FROM "Missing"')
+        assert connection.info["chinook_timing"] == []
+        connection.exec_driver_sql("SELECT 1").fetchall()
+        assert connection.info["chinook_timing"] == []
+    engine.dispose()